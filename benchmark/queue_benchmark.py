@@ -0,0 +1,180 @@
+"""
+SharedQueue transport benchmark and stress test, independent of video decoding.
+
+Synthetic producers put checksummed frame blocks, the consumer verifies them and measures throughput, latencies,
+fairness between producers, and watches for deadlocks.
+
+  python benchmark/queue_benchmark.py --producers 4 --item_frames 16 --consumer_delay 0.002
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from video2numpy.shared_queue import SharedQueue
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--producers", type=int, default=2, help="Number of producer processes")
+    parser.add_argument("--items", type=int, default=200, help="Items put by every producer")
+    parser.add_argument("--item_frames", type=int, default=8, help="(Max) number of frames per item")
+    parser.add_argument("--vary_items", action="store_true", help="Random item lengths in [1, item_frames]")
+    parser.add_argument("--frame_size", type=int, default=224, help="Frames are frame_size x frame_size x 3 uint8")
+    parser.add_argument("--queue_gb", type=float, default=0.25, help="Size of the shared memory")
+    parser.add_argument("--producer_delay", type=float, default=0.0, help="Seconds every producer waits between puts")
+    parser.add_argument("--consumer_delay", type=float, default=0.0, help="Seconds the consumer works on every item")
+    parser.add_argument("--stall_timeout", type=float, default=60.0, help="Seconds without progress = deadlock")
+    parser.add_argument("--out", type=str, default=None, help="Save report as JSON")
+    return parser.parse_args()
+
+
+def produce(producer_id, args, queue_export, results):
+    queue = SharedQueue.from_export(*queue_export)
+    rng = np.random.default_rng(producer_id)
+    frame_shape = (args.frame_size, args.frame_size, 3)
+    # random content generated once, every item gets a unique header so overwrites can't go unnoticed
+    pool = rng.integers(0, 256, size=(args.item_frames, *frame_shape), dtype=np.uint8)
+
+    put_times = []
+    for seq in range(args.items):
+        n_frames = int(rng.integers(1, args.item_frames + 1)) if args.vary_items else args.item_frames
+        item = np.roll(pool[:n_frames], seq, axis=0)
+        item[0, 0, :16, 0] = np.frombuffer(np.array([producer_id, seq], dtype=np.int64).tobytes(), dtype=np.uint8)
+        info = {"producer": producer_id, "seq": seq, "crc": zlib.crc32(item), "t_put": time.time()}
+
+        t0 = time.perf_counter()
+        queue.put(item, info)
+        put_times.append(time.perf_counter() - t0)
+        if args.producer_delay:
+            time.sleep(args.producer_delay)
+    results.put((producer_id, put_times))
+
+
+def percentiles(values):
+    if len(values) == 0:
+        return {"p50": None, "p99": None, "max": None}
+    arr = np.array(values) * 1000  # s -> ms
+    return {"p50": float(np.percentile(arr, 50)), "p99": float(np.percentile(arr, 99)), "max": float(arr.max())}
+
+
+def jain_index(values):
+    """1.0 = perfectly fair, 1/n = one producer got everything"""
+    arr = np.array(values, dtype=np.float64)
+    return float(arr.sum() ** 2 / (len(arr) * (arr**2).sum())) if arr.any() else 0.0
+
+
+def watchdog(progress, procs, queue, stall_timeout):
+    """Kills the benchmark if nothing was received for stall_timeout seconds"""
+    while True:
+        time.sleep(1.0)
+        if progress["done"]:
+            return
+        if time.time() - progress["last"] > stall_timeout:
+            print(f"DEADLOCK: no item received for {stall_timeout}[s]")
+            print(f"  received: {progress['received']}, producers alive: {sum(p.is_alive() for p in procs)}")
+            print(
+                f"  items in queue: {len(queue.index_queue.list)}, write lock: {queue.index_queue.lock_writing.value}"
+            )
+            for p in procs:
+                p.terminate()
+            queue.data_mem.unlink()
+            os._exit(2)  # pylint: disable=protected-access
+
+
+def main(args):
+    frame_bytes = args.frame_size**2 * 3
+    n_blocks = int(args.queue_gb * 1024**3) // frame_bytes
+    queue = SharedQueue.from_shape(n_blocks, args.frame_size, args.frame_size, 3, timeout=60.0, retry=True)
+
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=produce, args=(i, args, queue.export(), results), daemon=True)
+        for i in range(args.producers)
+    ]
+
+    progress = {"last": time.time(), "received": 0, "done": False}
+    threading.Thread(target=watchdog, args=(progress, procs, queue, args.stall_timeout), daemon=True).start()
+
+    expected = args.producers * args.items
+    corrupted, out_of_order, n_bytes = 0, 0, 0
+    next_seq = [0] * args.producers
+    received = [0] * args.producers
+    finished_at = [0.0] * args.producers
+    get_times, e2e_times = [], []
+
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+    while progress["received"] < expected:
+        if not queue:
+            if not any(p.is_alive() for p in procs) and not queue:
+                break  # producers died, nothing more will come
+            time.sleep(0.0005)
+            continue
+
+        t_get = time.perf_counter()
+        item, info = queue.get()
+        get_times.append(time.perf_counter() - t_get)
+        e2e_times.append(time.time() - info["t_put"])
+
+        pid, seq = info["producer"], info["seq"]
+        header = np.frombuffer(item[0, 0, :16, 0].tobytes(), dtype=np.int64)
+        if zlib.crc32(item) != info["crc"] or list(header) != [pid, seq]:
+            corrupted += 1
+        if seq != next_seq[pid]:
+            out_of_order += 1
+        next_seq[pid] = seq + 1
+        received[pid] += 1
+        finished_at[pid] = time.perf_counter() - t0
+        n_bytes += item.nbytes
+
+        progress["received"] += 1
+        progress["last"] = time.time()
+        if args.consumer_delay:
+            time.sleep(args.consumer_delay)
+    elapsed = time.perf_counter() - t0
+    progress["done"] = True
+
+    put_times = []
+    for _ in procs:
+        try:
+            put_times.extend(results.get(timeout=args.stall_timeout)[1])
+        except queue_module.Empty:
+            break
+    for p in procs:
+        p.join()
+    queue.data_mem.unlink()
+    queue.data_mem.close()
+
+    report = {
+        "config": vars(args),
+        "items": progress["received"],
+        "missing": expected - progress["received"],
+        "corrupted": corrupted,
+        "out_of_order": out_of_order,
+        "ops_per_s": progress["received"] / elapsed,
+        "gb_per_s": n_bytes / elapsed / 1024**3,
+        "put_latency_ms": percentiles(put_times),
+        "get_latency_ms": percentiles(get_times),
+        "end_to_end_latency_ms": percentiles(e2e_times),
+        # every producer puts the same number of items, so compare the rates at which they got them through
+        "fairness": jain_index([n / t if t else 0.0 for n, t in zip(received, finished_at)]),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out is not None:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    rep = main(parse_args())
+    if rep["corrupted"] or rep["missing"]:
+        raise SystemExit(1)
@@ -0,0 +1,263 @@
+"""
+Reproducible FrameReader benchmark on synthetic videos.
+
+  python benchmark/suite.py run --out results.json
+  python benchmark/suite.py compare baseline.json results.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+
+from synthetic_videos import CODECS, make_corpus
+from video2numpy.clip_sampler import ClipSampler
+from video2numpy.frame_reader import FrameReader
+
+
+SHM_PATH = "/dev/shm"
+SAMPLE_INTERVAL = 0.05  # [s] between memory measurements
+PAGE_SIZE = resource.getpagesize()
+BACKENDS = ["cv2"]  # FrameReader only wires up the opencv reader
+MODES = ["frames", "clips"]
+# metric -> direction in which it gets worse
+METRICS = {
+    "frames_per_s": -1,
+    "time_to_first_frame_s": 1,
+    "peak_rss_mb": 1,
+    "peak_shm_mb": 1,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Run the benchmark sweep and save results as JSON")
+    run.add_argument("--out", type=str, default="benchmark_results.json")
+    run.add_argument("--corpus_dir", type=str, default="benchmark/synthetic_vids")
+    run.add_argument("--lengths", type=int, nargs="+", default=[50, 250], help="Video lengths in frames")
+    run.add_argument("--resolutions", type=str, nargs="+", default=["320x240", "1280x720"])
+    run.add_argument("--codecs", type=str, nargs="+", default=["mp4v", "MJPG"], choices=list(CODECS))
+    run.add_argument(
+        "--gops", type=int, nargs="+", default=None, help="Keyframe intervals (needs ffmpeg, not for MJPG)"
+    )
+    run.add_argument("--copies", type=int, default=2, help="How many times every video is read per config")
+    run.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    run.add_argument("--resize_size", type=int, nargs="+", default=[64, 224])
+    run.add_argument("--take_every_nth", type=int, nargs="+", default=[1, 5])
+    run.add_argument("--batch_size", type=int, nargs="+", default=[-1])
+    run.add_argument("--backends", type=str, nargs="+", default=BACKENDS, choices=BACKENDS)
+    run.add_argument("--modes", type=str, nargs="+", default=MODES, choices=MODES)
+    run.add_argument("--ordered", type=int, nargs="+", default=[0, 1], choices=[0, 1], help="Unordered/ordered output")
+    run.add_argument("--reorder_window", type=int, default=16)
+    run.add_argument("--memory_size", type=float, default=1.0, help="GB of shared memory per reader")
+
+    compare = subparsers.add_parser("compare", help="Flag regressions of results against a baseline")
+    compare.add_argument("baseline", type=str)
+    compare.add_argument("results", type=str)
+    compare.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative change before flagging")
+    return parser.parse_args()
+
+
+def shm_used():
+    return shutil.disk_usage(SHM_PATH).used if os.path.isdir(SHM_PATH) else 0
+
+
+def tree_rss(root_pid):
+    """Returns summed RSS in bytes of root_pid and all its descendants (workers, queue managers)"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r", encoding="utf-8") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])  # comm can contain spaces and parentheses
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    rss = 0
+    pids = [root_pid]
+    while pids:
+        pid = pids.pop()
+        pids.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm", "r", encoding="utf-8") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue  # exited in the meantime
+    return rss
+
+
+class MemorySampler(threading.Thread):
+    """Samples RSS of the process tree and shared memory usage in the background, keeps their peaks"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.shm_0 = shm_used()
+        self.peak_rss = 0
+        self.peak_shm = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak_rss = max(self.peak_rss, tree_rss(os.getpid()))
+            self.peak_shm = max(self.peak_shm, shm_used() - self.shm_0)
+            self.stopped.wait(SAMPLE_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_config(vids, config, memory_size, reorder_window, results):
+    """Runs in its own process so RSS and shared memory measurements don't leak between configs"""
+    clip_sampler = ClipSampler(clips_per_video=4, clip_length=8, frame_stride=2) if config["mode"] == "clips" else None
+    reader = FrameReader(
+        vids,
+        take_every_nth=config["take_every_nth"],
+        resize_size=config["resize_size"],
+        batch_size=config["batch_size"],
+        workers=config["workers"],
+        memory_size=memory_size,
+        clip_sampler=clip_sampler,
+        ordered=config["ordered"],
+        reorder_window=reorder_window,
+    )
+    sampler = MemorySampler()
+    sampler.start()
+
+    t0 = time.perf_counter()
+    reader.start_reading()
+    t_first = None
+    n_frames = 0
+    for item in reader:
+        frames = item[0]
+        if t_first is None:
+            t_first = time.perf_counter() - t0
+        if clip_sampler is not None:
+            n_frames += frames.shape[0]  # one clip per item, batch_size doesn't apply
+        else:
+            n_frames += frames.shape[0] * (frames.shape[1] if config["batch_size"] != -1 else 1) - item[1]["pad_by"]
+    read_time = time.perf_counter() - t0
+    sampler.stop()
+
+    results.put(
+        {
+            "frames": n_frames,
+            "frames_per_s": n_frames / read_time,
+            "time_to_first_frame_s": t_first if t_first is not None else read_time,
+            "peak_rss_mb": sampler.peak_rss / 1024**2,  # summed over this process, workers and queue managers
+            "peak_shm_mb": sampler.peak_shm / 1024**2,
+        }
+    )
+
+
+def config_key(config):
+    return json.dumps(config, sort_keys=True)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    resolutions = [tuple(int(d) for d in r.split("x")) for r in args.resolutions]
+    gops = args.gops if args.gops is not None else [None]
+    vids, corpus = make_corpus(args.corpus_dir, args.lengths, resolutions, args.codecs, gops)
+    vids = vids * args.copies
+    print(f"Benchmarking on {len(vids)} synthetic videos...")
+
+    sweep = itertools.product(
+        args.backends, args.modes, args.ordered, args.workers, args.resize_size, args.take_every_nth, args.batch_size
+    )
+    results = []
+    for backend, mode, ordered, workers, resize_size, take_every_nth, batch_size in sweep:
+        if mode == "clips" and (take_every_nth != args.take_every_nth[0] or batch_size != args.batch_size[0]):
+            continue  # clip sampling ignores these
+        if mode == "clips" and ordered:
+            continue  # not supported
+        if mode == "clips":
+            take_every_nth, batch_size = 1, -1  # record what FrameReader actually uses
+        config = {
+            "backend": backend,
+            "mode": mode,
+            "ordered": bool(ordered),
+            "workers": workers,
+            "resize_size": resize_size,
+            "take_every_nth": take_every_nth,
+            "batch_size": batch_size,
+        }
+        out = multiprocessing.Queue()
+        proc = multiprocessing.Process(
+            target=run_config, args=(vids, config, args.memory_size, args.reorder_window, out)
+        )
+        proc.start()
+        metrics = out.get()
+        proc.join()
+        print(f"{config} -> {metrics}")
+        results.append({"config": config, "metrics": metrics})
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "corpus": dict(corpus, copies=args.copies),
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.out}")
+
+
+def compare(args):
+    """Returns number of regressions"""
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.results, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    if baseline["corpus"] != new["corpus"]:
+        print("Warning: results were measured on different corpora")
+    base_metrics = {config_key(r["config"]): r["metrics"] for r in baseline["results"]}
+
+    regressions = 0
+    for result in new["results"]:
+        key = config_key(result["config"])
+        if key not in base_metrics:
+            print(f"NEW        {key}")
+            continue
+        for metric, worse in METRICS.items():
+            old_val, new_val = base_metrics[key][metric], result["metrics"][metric]
+            change = (new_val - old_val) / old_val if old_val else 0.0
+            if change * worse > args.tolerance:
+                regressions += 1
+                print(f"REGRESSION {key} {metric}: {old_val:.3f} -> {new_val:.3f} ({change:+.1%})")
+    print(f"{regressions} regressions found (tolerance {args.tolerance:.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.command == "run":
+        run(arguments)
+    else:
+        sys.exit(1 if compare(arguments) else 0)
@@ -0,0 +1,102 @@
+"""generates deterministic synthetic videos to benchmark on"""
+import itertools
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+
+FPS = 25
+CODECS = {  # fourcc -> container
+    "mp4v": "mp4",  # MPEG-4 part 2, GOP of 12
+    "XVID": "avi",  # MPEG-4 part 2, GOP of 12
+    "MJPG": "avi",  # intra only
+}
+GOP_ENCODERS = {  # fourcc -> ffmpeg encoder writing the same codec with a custom GOP (intra only codecs have none)
+    "mp4v": ["-c:v", "mpeg4", "-vtag", "mp4v"],
+    "XVID": ["-c:v", "mpeg4", "-vtag", "xvid"],
+}
+
+
+def make_video(path, n_frames, width, height, codec, gop=None, seed=0):
+    """
+    Writes a video of a seeded random texture scrolling diagonally (so every frame differs, like real footage).
+
+    Input:
+      path - where to write the video to.
+      n_frames - length of the video in frames.
+      width, height - resolution of the video.
+      codec - fourcc from CODECS.
+      gop - keyframe interval, needs the ffmpeg binary and a codec from GOP_ENCODERS (None = codec default).
+      seed - seed of the texture.
+    """
+    if gop is not None and codec not in GOP_ENCODERS:
+        raise ValueError(f"{codec} has no GOP to set")
+    rng = np.random.default_rng(seed)
+    texture = rng.integers(0, 256, size=(height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    texture = cv2.resize(texture, (2 * width, 2 * height), interpolation=cv2.INTER_LINEAR)
+
+    tmp_path = path + ".tmp." + CODECS[codec]
+    writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*codec), FPS, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"OpenCV can't write {codec} videos")
+    for i in range(n_frames):
+        dx, dy = (3 * i) % width, (2 * i) % height
+        writer.write(texture[dy : dy + height, dx : dx + width])
+    writer.release()
+
+    if gop is None:
+        os.replace(tmp_path, path)
+        return
+    if shutil.which("ffmpeg") is None:
+        os.remove(tmp_path)
+        raise RuntimeError("Setting the GOP size needs the ffmpeg binary")
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-loglevel",
+        "error",
+        "-i",
+        tmp_path,
+        *GOP_ENCODERS[codec],
+        "-q:v",
+        "5",
+        "-g",
+        str(gop),
+        path,
+    ]
+    subprocess.run(cmd, check=True)
+    os.remove(tmp_path)
+
+
+def make_corpus(out_dir, lengths=(50, 250), resolutions=((320, 240), (1280, 720)), codecs=("mp4v",), gops=(None,)):
+    """
+    Generates one video per combination of parameters in out_dir (existing videos are reused).
+
+    Output:
+      list of video paths and description of the corpus.
+    """
+    no_gop = [codec for codec in codecs if codec not in GOP_ENCODERS]
+    if any(gop is not None for gop in gops) and no_gop:
+        raise ValueError(f"Custom GOPs can't be set for {no_gop}, leave them out of the codecs")
+    os.makedirs(out_dir, exist_ok=True)
+    vids = []
+    for seed, (n_frames, (width, height), codec, gop) in enumerate(
+        itertools.product(lengths, resolutions, codecs, gops)
+    ):
+        gop_name = "default" if gop is None else str(gop)
+        ext = CODECS[codec]
+        path = os.path.join(out_dir, f"{n_frames}f_{width}x{height}_{codec}_gop{gop_name}.{ext}")
+        if not os.path.exists(path):
+            make_video(path, n_frames, width, height, codec, gop, seed)
+        vids.append(path)
+
+    corpus = {
+        "lengths": list(lengths),
+        "resolutions": [list(r) for r in resolutions],
+        "codecs": list(codecs),
+        "gops": list(gops),
+    }
+    return vids, corpus
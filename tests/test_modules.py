@@ -1,9 +1,28 @@
+import asyncio
+import cv2
 import glob
+import multiprocessing
+import os
+import pytest
+import tarfile
+import tempfile
+import zipfile
+import time
+from multiprocessing.shared_memory import SharedMemory
 
 import numpy as np
 
+from video2numpy.autoscaler import Autoscaler
+from video2numpy.clip_sampler import ClipSampler
+from video2numpy.dedup import canonicalize, dedup, split_far_duplicates
+from video2numpy.frame_budget import FrameBudget
+from video2numpy.frame_filter import FrameFilter
+from video2numpy import read_vids_cv2
 from video2numpy.frame_reader import FrameReader
+from video2numpy.keyframe_index import KeyframeIndex, get_index, index_path, save_index, source_version
+from video2numpy.output_transform import CLIP_MEAN, CLIP_STD, OutputTransform
 from video2numpy.resizer import Resizer
+from video2numpy.utils import fallback_formats, get_format_selector
 
 
 FRAME_COUNTS = {
@@ -36,3 +55,560 @@ def test_resizer():
 
     resized_img = resizer(fake_img)
     assert resized_img.shape == (100, 100, 3)
+
+
+def test_clip_sampler():
+    sampler = ClipSampler(clips_per_video=4, clip_length=8, frame_stride=2, seed=42)
+    assert sampler.span == 15
+
+    starts = sampler("vid.mp4", 100)
+    assert len(starts) == 4
+    assert starts == sorted(starts)
+    assert all(0 <= s <= 100 - sampler.span for s in starts)
+    assert starts == sampler("vid.mp4", 100)  # reproducible
+
+    shorter = sampler("vid.mp4", 60)  # video turned out shorter, only clips past its end change
+    assert [s for s in starts if s <= 60 - sampler.span] == [s for s in shorter if s in starts]
+    assert len(shorter) == 4
+
+    sampler.set_epoch(1)
+    assert starts != sampler("vid.mp4", 100)  # different clips every epoch
+    assert sampler("vid.mp4", 10) == []  # too short for a single clip
+
+
+def test_clip_reader():
+    vids = sorted(glob.glob("tests/test_videos/*.mp4"))
+
+    sampler = ClipSampler(clips_per_video=3, clip_length=4, frame_stride=3, seed=0)
+    # the headers over-report the frame counts, clips past the real end get redrawn
+    expected = {ref: sampler(vid, FRAME_COUNTS[os.path.basename(vid)]) for ref, vid in enumerate(vids)}
+
+    def read_starts(**kwargs):
+        reader = FrameReader(vids, resize_size=64, memory_size=0.128, clip_sampler=sampler, **kwargs)
+        reader.start_reading()
+        starts = {ref: [] for ref in expected}
+        for clip, ref, start_time in reader:
+            assert clip.shape == (4, 64, 64, 3)
+            starts[ref].append(round(start_time * 25))  # both videos are 25 fps
+        return {ref: sorted(s) for ref, s in starts.items()}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for _ in range(2):  # builds the indices, then loads them
+            assert read_starts(index_dir=tmpdir) == expected
+        assert all(os.path.exists(index_path(vid, tmpdir)) for vid in vids)
+    assert read_starts() == expected  # no index, same clips
+
+    with pytest.raises(ValueError):
+        FrameReader(vids, take_every_nth=2, clip_sampler=sampler)  # would be silently ignored
+    with pytest.raises(ValueError):
+        FrameReader(vids, frame_filter=FrameFilter(), clip_sampler=sampler)
+
+    # spans overlap and the last clip drawn from the header frame count is past the end, seeks back for both
+    overlapping = ClipSampler(clips_per_video=8, clip_length=8, frame_stride=2, seed=0)
+    reader = FrameReader(["tests/test_videos/vid2.mp4"], resize_size=32, memory_size=0.128, clip_sampler=overlapping)
+    reader.start_reading()
+    starts = sorted(round(start_time * 25) for _, _, start_time in reader)
+    assert starts == overlapping("tests/test_videos/vid2.mp4", FRAME_COUNTS["vid2.mp4"])
+
+
+def test_keyframe_index():
+    vid = "tests/test_videos/vid2.mp4"
+    index = KeyframeIndex.build(vid)
+    assert index.frame_count == FRAME_COUNTS["vid2.mp4"]  # decodable frames, not the 179 packets in the container
+    assert index.keyframes[0] == 0 and all(k < index.frame_count for k in index.keyframes)
+    assert index.nearest_keyframe(index.keyframes[1] - 1) == 0
+    assert index.nearest_keyframe(index.keyframes[1]) == index.keyframes[1]
+    assert index.frame_at(index.pts[10] + 1.0) == 10
+    assert np.all(np.diff(index.pts) > 0)  # recorded timestamps
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        get_index(vid, vid, tmpdir)  # builds and saves
+        loaded = get_index(vid, "not_a_video.mp4", tmpdir)  # loads without opening the video
+        assert loaded.frame_count == KeyframeIndex.build(vid).frame_count
+        assert loaded.fps == index.fps
+
+        copy_path = os.path.join(tmpdir, "copy.mp4")
+        with open(vid, "rb") as src, open(copy_path, "wb") as dst:
+            dst.write(src.read())
+        old = get_index(copy_path, copy_path, tmpdir, source_version(copy_path, copy_path))
+        with open("tests/test_videos/vid1.mp4", "rb") as src, open(copy_path, "wb") as dst:  # replaced in place
+            dst.write(src.read())
+        new = get_index(copy_path, copy_path, tmpdir, source_version(copy_path, copy_path))
+        assert new.frame_count == KeyframeIndex.build(copy_path).frame_count != old.frame_count
+        assert source_version("https://youtu.be/x", "https://stream", 64) != source_version(
+            "https://youtu.be/x", "", 224
+        )
+
+
+def _save_and_load_index(index_dir, n_iters, errors):
+    index = KeyframeIndex([0, 12], np.arange(24) * 40.0, 25.0, version="v")
+    for _ in range(n_iters):
+        try:
+            save_index(index, "vid.mp4", index_dir)
+            assert get_index("vid.mp4", "not_a_video.mp4", index_dir, "v").frame_count == 24
+        except Exception as e:  # pylint: disable=broad-except
+            errors.put(repr(e))
+
+
+def test_concurrent_index_writes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        errors = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_save_and_load_index, args=(tmpdir, 100, errors)) for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        assert errors.empty()
+        assert os.listdir(tmpdir) == [os.path.basename(index_path("vid.mp4", tmpdir))]  # no temp files left
+
+
+def test_frame_filter():
+    black = np.zeros((48, 64, 3), dtype=np.uint8)
+    white = np.full((48, 64, 3), 255, dtype=np.uint8)
+    red = np.zeros((48, 64, 3), dtype=np.uint8)
+    red[:, :, 2] = 255
+
+    dedup = FrameFilter(mode="dedup")
+    kept = [dedup(frame) for frame in [black, black, white, white, black]]
+    assert kept == [True, False, True, False, True]
+
+    scene = FrameFilter(mode="scene")
+    kept = [scene(frame) for frame in [red, red, white, white, white, red]]
+    assert kept == [True, False, True, False, False, True]
+    scene.reset()
+    assert scene(white)
+
+
+def test_filtered_reader():
+    vids = glob.glob("tests/test_videos/*.mp4")
+
+    reader = FrameReader(vids, resize_size=32, memory_size=0.128, frame_filter=FrameFilter(threshold=0.02))
+    reader.start_reading()
+
+    for vid_frames, info in reader:
+        mp4_name = info["dst_name"][:-4] + ".mp4"
+        indices = info["frame_indices"]
+        assert len(indices) == vid_frames.shape[0]
+        assert 0 < len(indices) < FRAME_COUNTS[mp4_name]
+        assert indices == sorted(indices) and indices[0] == 0
+
+
+def test_frame_budget():
+    assert FrameBudget(num_frames=5).uniform_indices(100, 25.0) == [0, 25, 50, 74, 99]
+    assert FrameBudget(num_frames=5, max_duration=2.0).uniform_indices(100, 25.0) == [0, 12, 24, 37, 49]
+    assert FrameBudget(num_frames=5).uniform_indices(3, 25.0) == [0, 1, 2]
+    assert FrameBudget(num_frames=5).uniform_indices(0, 25.0) == []
+    assert FrameBudget(max_duration=1.5).stop_frame(25.0) == 38
+    assert FrameBudget(max_frames=10).stop_frame(25.0) is None
+    assert FrameBudget(max_frames=10).full(10) and not FrameBudget(max_duration=1.0).full(10)
+    with pytest.raises(ValueError):
+        FrameBudget(max_frames=10, num_frames=5)
+    with pytest.raises(ValueError):
+        FrameBudget()
+
+
+def test_budgeted_reader(monkeypatch):
+    vids = sorted(glob.glob("tests/test_videos/*.mp4"))
+
+    def read(frame_budget, **kwargs):
+        reader = FrameReader(vids, resize_size=32, memory_size=0.128, ordered=True, frame_budget=frame_budget, **kwargs)
+        reader.start_reading()
+        return list(reader)
+
+    assert [frames.shape[0] for frames, _ in read(FrameBudget(max_frames=10))] == [10, 10]
+    assert [frames.shape[0] for frames, _ in read(FrameBudget(max_duration=1.0), take_every_nth=2)] == [13, 13]
+
+    outputs = read(FrameBudget(num_frames=4, max_duration=4.0))
+    assert outputs[0][1]["frame_indices"] == [0, 24, 49]  # vid1 ends before its probed frame count
+    assert outputs[1][1]["frame_indices"] == [0, 33, 66, 99]
+    assert [info["budget_met"] for _, info in outputs] == [False, True]
+
+    full_vid2 = read(None)[1][0]
+    frames, info = read(FrameBudget(num_frames=2, max_duration=5.2))[1]  # seeks to frame 129
+    assert info["frame_indices"] == [0, 129]
+    assert np.abs(frames.astype(int) - full_vid2[[0, 129]]).mean() < 1.0
+
+    class NoSeekCapture:  # source which can't seek, f.e. some streams
+        def __init__(self, path):
+            self.cap = video_capture(path)
+
+        def set(self, prop, value):
+            return False if prop == cv2.CAP_PROP_POS_FRAMES else self.cap.set(prop, value)
+
+        def __getattr__(self, name):
+            return getattr(self.cap, name)
+
+    video_capture = cv2.VideoCapture
+    monkeypatch.setattr(cv2, "VideoCapture", NoSeekCapture)  # workers are forked, so they see it too
+    frames, info = read(FrameBudget(num_frames=2, max_duration=5.2))[1]
+    assert info["frame_indices"] == [0, 129]  # grabbed forward instead
+    assert np.abs(frames.astype(int) - full_vid2[[0, 129]]).mean() < 1.0
+    monkeypatch.undo()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        budget = FrameBudget(num_frames=4)
+        for _ in range(2):  # builds the indices, then loads them
+            outputs = read(budget, index_dir=tmpdir)  # real frame count from the start, seeks by keyframes
+            assert outputs[0][1]["frame_indices"] == [0, 18, 37, 55]  # vid1 is shorter than its header says
+            assert [frames.shape[0] for frames, _ in outputs] == [4, 4]
+        with pytest.raises(ValueError):
+            FrameReader(vids, index_dir=tmpdir, frame_budget=FrameBudget(max_frames=4))  # index would be unused
+
+    def local_url(url, *_):
+        return url.replace("https://example.com/", "tests/test_videos/"), None, url.split("/")[-1][:-4] + ".npy"
+
+    monkeypatch.setattr(read_vids_cv2, "handle_url", local_url)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        budget = FrameBudget(num_frames=4)
+        reader = FrameReader(
+            ["https://example.com/vid2.mp4"], resize_size=32, memory_size=0.128, frame_budget=budget, index_dir=tmpdir
+        )
+        reader.start_reading()
+        assert [info["budget_met"] for _, info in reader] == [False]  # header frame count
+        assert not os.listdir(tmpdir)  # links aren't streamed whole to build an index
+
+
+def test_output_transform():
+    frames = np.random.randint(0, 256, size=(2, 5, 8, 8, 3), dtype=np.uint8)
+
+    identity = OutputTransform()
+    assert identity(frames) is frames
+
+    transform = OutputTransform(layout="CHW", dtype="float32", mean=CLIP_MEAN, std=CLIP_STD)
+    out = transform(frames)
+    assert transform.frame_shape(8) == (3, 8, 8)
+    assert out.shape == (2, 5, 3, 8, 8) and out.dtype == np.float32
+    expected = (frames / 255.0 - np.array(CLIP_MEAN)) / np.array(CLIP_STD)
+    assert np.allclose(out, np.moveaxis(expected, -1, -3), atol=1e-5)
+
+
+def test_transformed_reader():
+    vids = glob.glob("tests/test_videos/*.mp4")
+
+    transform = OutputTransform(layout="CHW", dtype="float16", mean=CLIP_MEAN, std=CLIP_STD)
+    reader = FrameReader(vids, resize_size=32, batch_size=4, memory_size=0.128, output_transform=transform)
+    reader.start_reading()
+
+    for vid_frames, info in reader:
+        mp4_name = info["dst_name"][:-4] + ".mp4"
+        assert vid_frames.dtype == np.float16
+        assert vid_frames.shape[1:] == (4, 3, 32, 32)
+        assert vid_frames.shape[0] * 4 - info["pad_by"] == FRAME_COUNTS[mp4_name]
+        assert -3.0 < vid_frames.min() and vid_frames.max() < 3.0
+        if info["pad_by"] > 0:
+            assert not vid_frames[-1, -info["pad_by"] :].any()  # padding is zeros, not normalized zeros
+
+
+def test_async_reader():
+    vids = glob.glob("tests/test_videos/*.mp4")
+
+    async def read_all():
+        frame_counts = {}
+        async with FrameReader(vids, resize_size=32, memory_size=0.128) as reader:
+            async for vid_frames, info in reader:
+                await asyncio.sleep(0)  # let other tasks run
+                frame_counts[info["dst_name"][:-4] + ".mp4"] = vid_frames.shape[0]
+        return frame_counts
+
+    assert asyncio.run(read_all()) == FRAME_COUNTS
+
+
+def test_async_reader_cancel(monkeypatch):
+    vids = glob.glob("tests/test_videos/*.mp4") * 4
+
+    async def cancel_after_first(reader):
+        got_first = asyncio.Event()
+
+        async def consume():
+            async with reader:
+                async for _ in reader:
+                    got_first.set()
+                    await asyncio.sleep(60)  # slow consumer, cancelled in the loop body
+
+        task = asyncio.ensure_future(consume())
+        await got_first.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    async def cancel_while_waiting(reader):
+        reader.start_reading()
+        monkeypatch.setattr(reader, "_poll", lambda flush=False: None)  # pretend the workers are slow to put anything
+        task = asyncio.ensure_future(reader.__anext__())
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    for cancel in [cancel_after_first, cancel_while_waiting]:
+        reader = FrameReader(vids, resize_size=32, workers=2, memory_size=0.128)
+        asyncio.run(cancel(reader))
+        assert reader.released
+        assert not any(p.is_alive() for p in reader.procs)
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=reader.shared_queue.data_mem.name)
+
+
+def test_ordered_reader():
+    vids = sorted(glob.glob("tests/test_videos/*.mp4"))
+    vids = vids * 3 + ["tests/test_videos/missing.mp4"] + vids
+
+    reader = FrameReader(vids, resize_size=32, workers=3, memory_size=0.128, ordered=True, reorder_window=2)
+    reader.start_reading()
+    refs = [info["reference"] for _, info in reader]
+    assert refs == [i for i in range(len(vids)) if i != 6]  # in order, without the video that failed
+
+    async def read_all():
+        async with FrameReader(vids, resize_size=32, workers=2, memory_size=0.128, ordered=True) as async_reader:
+            return [info["reference"] async for _, info in async_reader]
+
+    assert asyncio.run(read_all()) == refs
+
+
+def test_autoscaler():
+    autoscaler = Autoscaler(min_workers=1, max_workers=3, interval=0.05, cpu_threshold=1.01)
+    assert autoscaler(2, consumer_wait=10.0, producer_stall=0.0) is None  # interval not over yet
+
+    time.sleep(0.1)
+    assert autoscaler(2, consumer_wait=10.0, producer_stall=0.0) == 3  # consumer waited the whole interval
+    time.sleep(0.1)
+    assert autoscaler(3, consumer_wait=20.0, producer_stall=0.0) == 3  # already at max_workers
+    time.sleep(0.1)
+    assert autoscaler(3, consumer_wait=20.0, producer_stall=10.0) == 2  # workers stalled on a full queue
+    time.sleep(0.1)
+    assert autoscaler(2, consumer_wait=20.0, producer_stall=10.0) == 2  # nothing changed
+
+
+def test_autoscaled_reader():
+    vids = glob.glob("tests/test_videos/*.mp4") * 4
+
+    autoscaler = Autoscaler(min_workers=1, max_workers=3, interval=0.1, cpu_threshold=1.01)
+    reader = FrameReader(vids, resize_size=32, memory_size=0.128, autoscaler=autoscaler)
+    reader.start_reading()
+
+    refs = []
+    for vid_frames, info in reader:
+        refs.append(info["reference"])
+        assert vid_frames.shape[0] == FRAME_COUNTS[info["dst_name"][:-4] + ".mp4"]
+    assert sorted(refs) == list(range(len(vids)))
+    assert sum(p.pid is not None for p in reader.procs) > 1  # consumer waited, so workers were added
+
+
+def test_archive_reader():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tar_path, zip_path = os.path.join(tmpdir, "shard.tar.gz"), os.path.join(tmpdir, "shard.zip")
+        with tarfile.open(tar_path, "w:gz") as tf:
+            tf.add("tests/test_videos/vid1.mp4", arcname="a/vid1.mp4")
+            tf.add("tests/test_videos/test_list.txt", arcname="test_list.txt")  # not a video, skipped
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            zf.write("tests/test_videos/vid1.mp4", arcname="vid1.mp4")
+            zf.write("tests/test_videos/vid2.mp4", arcname="b/vid2.mp4")
+
+        reader = FrameReader([tar_path, zip_path], resize_size=32, workers=2, memory_size=0.128)
+        reader.start_reading()
+
+        members = {}
+        for vid_frames, info in reader:
+            members[(info["reference"], info["member"])] = info["dst_name"]
+            assert vid_frames.shape[0] == FRAME_COUNTS[info["member"].split("/")[-1]]
+        assert members == {
+            (0, "a/vid1.mp4"): "a_vid1.npy",
+            (1, "vid1.mp4"): "vid1.npy",
+            (1, "b/vid2.mp4"): "b_vid2.npy",
+        }
+
+
+def test_stopped_archive_reader(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tar_path, members_dir = os.path.join(tmpdir, "shard.tar"), os.path.join(tmpdir, "members")
+        os.mkdir(members_dir)
+        with tarfile.open(tar_path, "w") as tf:
+            for i in range(6):
+                tf.add("tests/test_videos/vid2.mp4", arcname=f"vid2_{i}.mp4")
+        monkeypatch.setattr(tempfile, "tempdir", members_dir)  # inherited by the forked worker
+
+        # small queue so the worker blocks on put while it holds a member
+        reader = FrameReader([tar_path], resize_size=224, workers=1, memory_size=0.05)
+        reader.start_reading()
+        next(iter(reader))
+        reader.stop_reading()
+
+        assert glob.glob(os.path.join(members_dir, "*.mp4")) == []
+
+
+def test_dedup():
+    assert canonicalize("https://youtu.be/abc123?t=10") == "youtube:abc123"
+    assert canonicalize("https://www.youtube.com/watch?v=abc123&list=x") == "youtube:abc123"
+    assert canonicalize("https://CDN.example.com/v.mp4?sig=1#t") == "https://cdn.example.com/v.mp4"
+    assert canonicalize("https://example.com/get?id=1") == "https://example.com/get?id=1"
+    assert canonicalize("tests/test_videos/./vid1.mp4") == os.path.abspath("tests/test_videos/vid1.mp4")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        copy_path = os.path.join(tmpdir, "copy.mp4")
+        with open("tests/test_videos/vid1.mp4", "rb") as src, open(copy_path, "wb") as dst:
+            dst.write(src.read())
+        vid_refs = [("tests/test_videos/vid1.mp4", 0), (copy_path, 1), ("tests/test_videos/vid2.mp4", 2)]
+        assert dedup(vid_refs)[1] == [0, 1, 2]
+        unique_vids, group_ids = dedup(vid_refs, hash_bytes=4096)  # same content
+        assert unique_vids == ["tests/test_videos/vid1.mp4", "tests/test_videos/vid2.mp4"]
+        assert group_ids == [0, 0, 1]
+
+
+def test_dedup_reader():
+    vids = ["tests/test_videos/vid1.mp4", "tests/test_videos/vid2.mp4", "tests/test_videos/./vid1.mp4"]
+    vids += [os.path.abspath("tests/test_videos/vid2.mp4"), "tests/test_videos/vid1.mp4"]
+
+    reader = FrameReader(vids, resize_size=32, workers=2, memory_size=0.128, dedup_inputs=True)
+    assert len(reader.ref_groups) == 2  # only two videos get decoded
+    reader.start_reading()
+    refs = []
+    for vid_frames, info in reader:
+        refs.append(info["reference"])
+        assert vid_frames.shape[0] == FRAME_COUNTS[os.path.basename(vids[info["reference"]])]
+    assert sorted(refs) == list(range(len(vids)))
+
+    reader = FrameReader(vids, resize_size=32, workers=2, memory_size=0.128, ordered=True, dedup_inputs=True)
+    reader.start_reading()
+    assert [info["reference"] for _, info in reader] == [0, 1, 2, 3, 4]  # every ref at its own position
+
+    clip_sampler = ClipSampler(clips_per_video=1, clip_length=4)
+    reader = FrameReader(vids, resize_size=32, memory_size=0.128, clip_sampler=clip_sampler, dedup_inputs=True)
+    reader.start_reading()
+    assert sorted(ref for _, ref, _ in reader) == list(range(len(vids)))
+
+    refs = list("abcdef")
+    vids = ["tests/test_videos/vid1.mp4", "tests/test_videos/vid2.mp4", "tests/test_videos/missing.mp4"] * 2
+    reader = FrameReader(vids, refs, resize_size=32, memory_size=0.128, ordered=True, dedup_inputs=True)
+    reader.start_reading()
+    assert [info["reference"] for _, info in reader] == ["a", "b", "d", "e"]
+    assert not reader.reorder_buffer  # released after the last duplicate
+
+    assert split_far_duplicates(["x", "y"], [0, 1, 0, 1, 0, 1], 2) == (
+        ["x", "y", "x", "y", "x", "y"],
+        [0, 1, 2, 3, 4, 5],
+    )
+    assert split_far_duplicates(["x", "y"], [0, 1, 0, 0, 1, 0], 3) == (["x", "y", "x", "y"], [0, 1, 0, 2, 3, 2])
+
+    vids = ["tests/test_videos/vid1.mp4", "tests/test_videos/vid2.mp4"] * 3
+    reader = FrameReader(vids, resize_size=32, memory_size=0.128, ordered=True, dedup_inputs=True, reorder_window=2)
+    assert len(reader.scheduler.vid_refs) == 6  # duplicates further apart than the window are read again
+    reader.start_reading()
+    assert [info["reference"] for _, info in reader] == list(range(6))
+    reader = FrameReader(vids, resize_size=32, memory_size=0.128, ordered=True, dedup_inputs=True)
+    assert len(reader.scheduler.vid_refs) == 2
+    reader.start_reading()
+    assert [info["reference"] for _, info in reader] == list(range(6))
+
+
+YOUTUBE_FORMATS = [  # trimmed yt-dlp format list
+    {"format_id": "sb0", "ext": "mhtml", "protocol": "mhtml", "vcodec": "none", "acodec": "none"},
+    {"format_id": "140", "ext": "m4a", "protocol": "https", "vcodec": "none", "acodec": "mp4a.40.2", "tbr": 129},
+    {
+        "format_id": "18",
+        "ext": "mp4",
+        "protocol": "https",
+        "vcodec": "avc1.42001E",
+        "acodec": "mp4a.40.2",
+        "width": 640,
+        "height": 360,
+        "tbr": 500,
+    },
+    {
+        "format_id": "160",
+        "ext": "mp4",
+        "protocol": "https",
+        "vcodec": "avc1.4d400c",
+        "acodec": "none",
+        "width": 256,
+        "height": 144,
+        "tbr": 110,
+    },
+    {
+        "format_id": "278",
+        "ext": "webm",
+        "protocol": "https",
+        "vcodec": "vp9",
+        "acodec": "none",
+        "width": 256,
+        "height": 144,
+        "tbr": 95,
+    },
+    {
+        "format_id": "133",
+        "ext": "mp4",
+        "protocol": "https",
+        "vcodec": "avc1.4d4015",
+        "acodec": "none",
+        "width": 426,
+        "height": 240,
+        "tbr": 240,
+    },
+    {
+        "format_id": "395",
+        "ext": "mp4",
+        "protocol": "https",
+        "vcodec": "av01.0.00M.08",
+        "acodec": "none",
+        "width": 426,
+        "height": 240,
+        "tbr": 150,
+    },
+    {
+        "format_id": "134",
+        "ext": "mp4",
+        "protocol": "https",
+        "vcodec": "avc1.4d401e",
+        "acodec": "none",
+        "width": 640,
+        "height": 360,
+        "tbr": 600,
+    },
+    {
+        "format_id": "604",
+        "ext": "mp4",
+        "protocol": "m3u8_native",
+        "vcodec": "avc1.4d401e",
+        "acodec": "none",
+        "width": 640,
+        "height": 360,
+        "tbr": 500,
+    },
+    {
+        "format_id": "136",
+        "ext": "mp4",
+        "protocol": "https",
+        "vcodec": "avc1.4d401f",
+        "acodec": "none",
+        "width": 1280,
+        "height": 720,
+        "tbr": 1500,
+    },
+]
+
+
+@pytest.mark.parametrize(
+    "resize_size,retry,format_id",
+    [
+        (64, 0, "160"),  # smallest stream, avc1 is cheaper to decode than vp9
+        (200, 0, "133"),  # smallest stream with short side >= 200, avc1 over av01
+        (200, 1, "160"),  # retries after timeouts take the next smaller stream
+        (360, 1, "133"),
+        (360, 2, "160"),
+        (224, 0, "133"),
+        (360, 0, "134"),  # direct download over m3u8
+        (512, 0, "136"),
+        (1080, 0, "136"),  # nothing big enough, take the largest
+        (None, 0, "134"),  # 360p by default
+        (64, 1, "160"),  # nothing cheaper than the smallest avc1 stream, stay on it
+        (1080, 1, "134"),
+    ],
+)
+def test_format_selector(resize_size, retry, format_id):
+    selected = list(get_format_selector(retry, resize_size)({"formats": YOUTUBE_FORMATS}))
+    assert [f["format_id"] for f in selected] == [format_id]
+
+
+def test_fallback_formats():
+    only_360p = [f for f in YOUTUBE_FORMATS if f.get("height") == 360 and f["acodec"] == "none"]
+    chain = [f["format_id"] for f in fallback_formats(only_360p, 360)]
+    assert chain == ["134", "604"]  # no smaller stream, lower bitrate with the same codec
@@ -31,3 +31,11 @@ def test_read():
             frames = np.load(os.path.join(tmpdir, ld))
             assert frames.shape[0] == FRAME_COUNTS[vid] // take_en  # frame count
             assert frames.shape[1:] == (rs, rs, 3)  # embed dim
+
+
+def test_read_dedup(monkeypatch):
+    saved = []
+    monkeypatch.setattr(np, "save", lambda path, frames: saved.append((os.path.basename(path), frames.shape[0])))
+    vids = ["tests/test_videos/vid1.mp4", "tests/test_videos/./vid1.mp4", "tests/test_videos/vid2.mp4"]
+    video2numpy(vids, "", resize_size=32, memory_size=0.125, dedup_inputs=True)
+    assert sorted(saved) == [("vid1.npy", FRAME_COUNTS["vid1.mp4"]), ("vid2.npy", FRAME_COUNTS["vid2.mp4"])]
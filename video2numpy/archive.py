@@ -0,0 +1,69 @@
+"""archive - streams videos out of tar and zip archives"""
+import os
+import shutil
+import signal
+import sys
+import tarfile
+import tempfile
+import zipfile
+
+
+ARCHIVE_EXTS = (".tar", ".tar.gz", ".tgz", ".zip")
+VIDEO_EXTS = (".mp4", ".avi", ".mkv", ".mov", ".webm")
+MAX_MEMBER_SIZE = 2 * 1024**3  # [bytes] bigger members are skipped so a temp file never exceeds this
+COPY_BUFFER_SIZE = 1024**2
+
+
+def _exit(signum, _):
+    sys.exit(128 + signum)
+
+
+def exit_on_sigterm():
+    """
+    Makes SIGTERM (FrameReader.stop_reading) exit the worker through normal cleanup, so the temporary copy of the
+    member being read is deleted instead of being left in TMPDIR.
+    """
+    signal.signal(signal.SIGTERM, _exit)
+
+
+def is_archive(vid):
+    return vid.lower().endswith(ARCHIVE_EXTS)
+
+
+def _members(archive):
+    """yields (member name, size, file object) of videos in archive, reading it sequentially"""
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(VIDEO_EXTS):
+                    with zf.open(info) as f:
+                        yield info.filename, info.file_size, f
+    else:
+        with tarfile.open(archive, "r|*") as tf:  # stream mode, never seeks back
+            for info in tf:
+                if info.isfile() and info.name.lower().endswith(VIDEO_EXTS):
+                    yield info.name, info.size, tf.extractfile(info)
+
+
+def iter_videos(vid):
+    """
+    Yields (load_vid, member) for every video in vid. For plain videos and links that's just (vid, None), for archives
+    every member is copied to a temporary file (TMPDIR, f.e. /dev/shm to keep it in memory) that's deleted once the
+    next member is requested.
+    """
+    if not is_archive(vid):
+        yield vid, None
+        return
+
+    for member, size, f in _members(vid):
+        if size > MAX_MEMBER_SIZE:
+            print(f"Warning: skipping {member} in {vid}, it's larger than {MAX_MEMBER_SIZE} bytes")
+            continue
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(member)[1]) as tmp:
+            shutil.copyfileobj(f, tmp, COPY_BUFFER_SIZE)
+            tmp.flush()
+            yield tmp.name, member
+
+
+def member_dst_name(member):
+    return os.path.splitext(member)[0].replace("/", "_") + ".npy"
@@ -0,0 +1,97 @@
+"""autoscaler - decides how many workers should be reading"""
+import os
+import time
+
+
+def cpu_times():
+    """Returns (busy, total) cpu time since boot, None if it can't be measured"""
+    try:
+        with open("/proc/stat", "r", encoding="utf-8") as f:
+            fields = [float(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0.0)  # idle + iowait
+    return sum(fields) - idle, sum(fields)
+
+
+class Autoscaler:
+    """
+    Class for scaling the number of active workers between min_workers and max_workers.
+
+    Every interval seconds it looks at how the last interval went:
+      - workers stalled in SharedQueue.put -> the consumer is the bottleneck, park a worker
+      - consumer waited for frames and the cpu has room -> workers are the bottleneck, add a worker
+    """
+
+    def __init__(
+        self, min_workers, max_workers, interval=5.0, wait_threshold=0.1, stall_threshold=0.2, cpu_threshold=0.9
+    ):
+        """
+        Input:
+          min_workers - never park below this many workers.
+          max_workers - never run more than this many workers.
+          interval - seconds between scaling decisions.
+          wait_threshold - fraction of the interval the consumer can wait for frames before a worker is added.
+          stall_threshold - fraction of worker time spent waiting to put frames before a worker is parked.
+          cpu_threshold - don't add workers when cpu utilization is above this.
+        """
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError("Autoscaler needs 1 <= min_workers <= max_workers")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.wait_threshold = wait_threshold
+        self.stall_threshold = stall_threshold
+        self.cpu_threshold = cpu_threshold
+        self.reset()
+
+    def reset(self):
+        self.t_last = time.perf_counter()
+        self.wait_last = 0.0
+        self.stall_last = 0.0
+        self.cpu_last = cpu_times()
+
+    def cpu_utilization(self):
+        cpu_now = cpu_times()
+        if cpu_now is None or self.cpu_last is None or cpu_now[1] == self.cpu_last[1]:
+            load = os.getloadavg()[0] if hasattr(os, "getloadavg") else 0.0
+            return min(load / (os.cpu_count() or 1), 1.0)
+        util = (cpu_now[0] - self.cpu_last[0]) / (cpu_now[1] - self.cpu_last[1])
+        self.cpu_last = cpu_now
+        return util
+
+    def __call__(self, active, consumer_wait, producer_stall):
+        """
+        Input:
+          active - number of currently active workers.
+          consumer_wait - total seconds the consumer spent waiting for frames so far.
+          producer_stall - total seconds workers spent waiting in SharedQueue.put so far.
+
+        Output:
+          number of workers that should be active (None if the interval isn't over yet).
+        """
+        now = time.perf_counter()
+        elapsed = now - self.t_last
+        if elapsed < self.interval:
+            return None
+
+        wait_frac = (consumer_wait - self.wait_last) / elapsed
+        stall_frac = (producer_stall - self.stall_last) / (elapsed * active)
+        cpu = self.cpu_utilization()
+        self.t_last, self.wait_last, self.stall_last = now, consumer_wait, producer_stall
+
+        target = active
+        if stall_frac > self.stall_threshold and active > self.min_workers:
+            target = active - 1
+            reason = "workers stalled on a full queue"
+        elif wait_frac > self.wait_threshold and cpu < self.cpu_threshold and active < self.max_workers:
+            target = active + 1
+            reason = "consumer waiting for frames"
+        else:
+            return active
+
+        print(
+            f"Autoscaler: {active} -> {target} workers ({reason}: "
+            f"consumer wait {wait_frac:.0%}, worker stall {stall_frac:.0%}, cpu {cpu:.0%})"
+        )
+        return target
@@ -0,0 +1,52 @@
+"""clip sampler - decides which clips to take from a video"""
+import hashlib
+import numpy as np
+
+
+class ClipSampler:
+    """
+    Class for randomly sampling fixed length clips from videos, reproducibly per epoch.
+    Every start frame gets a seeded random priority and the clips_per_video starts with the lowest priorities are
+    taken, so a video that turns out shorter than its header says keeps the clips which still fit and only the
+    ones past its end are redrawn.
+    """
+
+    def __init__(self, clips_per_video, clip_length, frame_stride=1, seed=0):
+        """
+        Input:
+          clips_per_video - how many clips to sample from each video.
+          clip_length - number of frames in each clip.
+          frame_stride - offset between consecutive frames of a clip.
+          seed - base seed, combined with the epoch and the video to pick clip start frames.
+        """
+        self.clips_per_video = clips_per_video
+        self.clip_length = clip_length
+        self.frame_stride = frame_stride
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    @property
+    def span(self):
+        """number of consecutive source frames one clip covers"""
+        return (self.clip_length - 1) * self.frame_stride + 1
+
+    def __call__(self, vid, frame_count):
+        """
+        Input:
+          vid - path or link of the video (used to seed the sampling).
+          frame_count - number of frames in the video.
+
+        Output:
+          sorted list of clip start frame indices (empty if the video is shorter than one clip).
+        """
+        n_starts = frame_count - self.span + 1
+        if n_starts <= 0:
+            return []
+
+        # hashed deterministically, unlike hash() which is salted per process
+        seed = int.from_bytes(hashlib.sha1(f"{self.seed}-{self.epoch}-{vid}".encode("utf-8")).digest()[:8], "little")
+        priorities = np.random.default_rng(seed).random(n_starts)  # prefix of the same sequence for any frame_count
+        return sorted(int(s) for s in np.argsort(priorities, kind="stable")[: self.clips_per_video])
@@ -0,0 +1,93 @@
+"""dedup - finds duplicate videos in the input so they only get read once"""
+import hashlib
+import os
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+from .archive import VIDEO_EXTS
+
+
+def youtube_id(parts):
+    """Returns video id of a youtube link or None"""
+    host = parts.netloc.lower().split(":")[0]
+    if host.endswith("youtu.be"):
+        return parts.path.strip("/").split("/")[0] or None
+    if host.endswith("youtube.com"):
+        if parts.path == "/watch":
+            return parse_qs(parts.query).get("v", [None])[0]
+        path = parts.path.strip("/").split("/")
+        if len(path) == 2 and path[0] in ("shorts", "embed", "live", "v"):
+            return path[1]
+    return None
+
+
+def canonicalize(vid):
+    """
+    Returns a name which is the same for all spellings of the same video:
+      - youtube links -> youtube:<video id>
+      - links to video files -> lowercase scheme and host, no query string or fragment
+      - other links -> lowercase scheme and host, no fragment
+      - paths -> absolute path with symlinks resolved
+    """
+    if not (vid.startswith("http://") or vid.startswith("https://")):
+        return os.path.realpath(os.path.expanduser(vid))
+
+    parts = urlsplit(vid)
+    yt_id = youtube_id(parts)
+    if yt_id is not None:
+        return "youtube:" + yt_id
+    query = "" if parts.path.lower().endswith(VIDEO_EXTS) else parts.query  # query strings of files are for tracking
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+def content_key(path, hash_bytes):
+    """Returns (size, hash of first hash_bytes bytes) of a local file, None if it can't be read"""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read(hash_bytes)).hexdigest()
+    except OSError:
+        return None
+    return size, digest
+
+
+def dedup(vid_refs, hash_bytes=0):
+    """
+    Input:
+      vid_refs - list of (video, reference) pairs.
+      hash_bytes - also compare size and hash of the first hash_bytes bytes of local files (0 = only compare names).
+
+    Output:
+      unique_vids - first spelling of every distinct video, in order of first occurrence.
+      group_ids - group_ids[i] is the index in unique_vids of the video of vid_refs[i].
+    """
+    unique_vids, group_ids = [], []
+    group_of = {}
+    for vid, _ in vid_refs:
+        key = canonicalize(vid)
+        if hash_bytes > 0 and not key.startswith(("http://", "https://", "youtube:")):
+            key = content_key(key, hash_bytes) or key
+        if key not in group_of:
+            group_of[key] = len(unique_vids)
+            unique_vids.append(vid)
+        group_ids.append(group_of[key])
+    return unique_vids, group_ids
+
+
+def split_far_duplicates(unique_vids, group_ids, window):
+    """
+    Input:
+      unique_vids, group_ids - output of dedup.
+      window - max number of positions a duplicate can come after the first input it's read for.
+
+    Output:
+      unique_vids, group_ids - same as dedup, with duplicates further than window positions from the first input of
+                               their group moved to a new group (the video gets read again for them).
+    """
+    new_vids, new_ids = [], []
+    open_group = {}  # group id -> (new group id, position of its first input)
+    for pos, group_id in enumerate(group_ids):
+        if group_id not in open_group or pos - open_group[group_id][1] >= window:
+            open_group[group_id] = (len(new_vids), pos)
+            new_vids.append(unique_vids[group_id])
+        new_ids.append(open_group[group_id][0])
+    return new_vids, new_ids
@@ -0,0 +1,57 @@
+"""frame budget - bounds how much of every video gets decoded"""
+import numpy as np
+
+
+class FrameBudget:
+    """
+    Class for bounding the cost of reading a video, decoding stops as soon as the budget is met:
+      - max_frames - keep at most this many frames.
+      - max_duration - only read the first max_duration seconds.
+      - num_frames - take num_frames frames spaced uniformly over the video (over its first max_duration seconds if
+                     given) by seeking between them, instead of every take_every_nth frame.
+    """
+
+    def __init__(self, max_frames=None, max_duration=None, num_frames=None):
+        """
+        Input:
+          max_frames - max number of frames kept per video (None = no limit).
+          max_duration - seconds from the start of the video after which decoding stops (None = no limit).
+          num_frames - number of uniformly spaced frames to take, positions are computed from the probed frame count
+                       so fewer frames come out when a video turns out shorter than its header says.
+        """
+        if max_frames is not None and num_frames is not None:
+            raise ValueError("FrameBudget takes either max_frames or num_frames, not both")
+        if max_frames is None and max_duration is None and num_frames is None:
+            raise ValueError("FrameBudget needs max_frames, max_duration or num_frames")
+        self.max_frames = max_frames
+        self.max_duration = max_duration
+        self.num_frames = num_frames
+
+    def stop_frame(self, fps):
+        """index of the first frame past max_duration (None = no limit)"""
+        if self.max_duration is None or fps <= 0:
+            return None
+        return int(round(self.max_duration * fps))
+
+    def full(self, n_frames):
+        """True once n_frames kept frames use up max_frames"""
+        return self.max_frames is not None and n_frames >= self.max_frames
+
+    def uniform_indices(self, frame_count, fps):
+        """
+        Input:
+          frame_count - probed number of frames in the video.
+          fps - frames per second of the video.
+
+        Output:
+          sorted list of num_frames uniformly spaced frame indices (all frames if the video has fewer).
+        """
+        end = frame_count
+        stop = self.stop_frame(fps)
+        if stop is not None:
+            end = min(end, stop)
+        if end <= 0:
+            return []
+        if self.num_frames >= end:
+            return list(range(end))
+        return np.linspace(0, end - 1, self.num_frames).round().astype(int).tolist()
@@ -0,0 +1,57 @@
+"""frame filter - drops redundant frames before they get resized and put on the queue"""
+import cv2
+import numpy as np
+
+
+THUMB_SIZE = 16
+HIST_BINS = [16, 16]
+DEFAULT_THRESHOLDS = {"dedup": 0.03, "scene": 0.4}
+
+
+class FrameFilter:
+    """
+    Class for filtering out frames that don't add anything new to what was already taken from a video
+    """
+
+    def __init__(self, threshold=None, mode="dedup"):
+        """
+        Input:
+          threshold - minimum difference to the reference frame for a frame to be kept (None = default for mode).
+          mode - "dedup": compare a grayscale thumbnail against the last kept frame (mean absolute difference in [0, 1])
+                 "scene": compare a hue/saturation histogram against the previous frame (Bhattacharyya distance in
+                          [0, 1]) and keep only the first frame of every shot.
+        """
+        if mode not in ("dedup", "scene"):
+            raise ValueError(f"Unknown filter mode {mode}")
+        self.threshold = DEFAULT_THRESHOLDS[mode] if threshold is None else threshold
+        self.mode = mode
+        self.reference = None
+
+    def reset(self):
+        """Call before starting a new video"""
+        self.reference = None
+
+    def _features(self, frame):
+        if self.mode == "dedup":
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            return cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        hist = cv2.calcHist([hsv], [0, 1], None, HIST_BINS, [0, 180, 0, 256])
+        return cv2.normalize(hist, hist)
+
+    def _distance(self, features):
+        if self.mode == "dedup":
+            return float(np.abs(features - self.reference).mean())
+        return cv2.compareHist(self.reference, features, cv2.HISTCMP_BHATTACHARYYA)
+
+    def __call__(self, frame):
+        """Returns True if frame should be kept"""
+        features = self._features(frame)
+        if self.reference is None:
+            self.reference = features
+            return True
+
+        keep = self._distance(features) > self.threshold
+        if keep or self.mode == "scene":  # scene mode detects cuts between consecutive frames
+            self.reference = features
+        return keep
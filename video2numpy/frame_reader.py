@@ -1,12 +1,21 @@
 """reader - uses a reader function to read frames from videos"""
+import asyncio
 import multiprocessing
 import random
 import time
 
+from .archive import is_archive
+from .dedup import dedup, split_far_duplicates
+from .output_transform import OutputTransform
+from .read_clips_cv2 import read_clips
 from .read_vids_cv2 import read_vids
+from .scheduler import Scheduler
 from .shared_queue import SharedQueue
 
 
+POLL_INTERVAL = 0.01  # [s] between checks of an empty SharedQueue (or for the next video in order), sync and async
+
+
 class FrameReader:
     """
     Iterates over frame blocks returned by read_vids function
@@ -22,10 +31,21 @@ class FrameReader:
         batch_size=-1,
         workers=1,
         memory_size=4,
+        clip_sampler=None,
+        index_dir=None,
+        frame_filter=None,
+        output_transform=None,
+        ordered=False,
+        reorder_window=16,
+        autoscaler=None,
+        dedup_inputs=False,
+        dedup_hash_bytes=0,
+        frame_budget=None,
     ):
         """
         Input:
-          vids - list with youtube links or paths to mp4 files.
+          vids - list with youtube links, paths to mp4 files or paths to tar/zip archives of videos. Every archive is
+                 read sequentially by one worker, info["member"] is then the name of the video in the archive.
           refs - list with refrences to other data for each video (could correspondance to metadata in other file).
                  if None, refs = index of video
           chunk_size - how many videos to process at once.
@@ -35,32 +55,130 @@ class FrameReader:
           batch_size - max length of frame sequence to put on shared_queue (-1 = no max).
           workers - number of Processes to distribute video reading to.
           memory_size - number of GB of shared_memory
+          clip_sampler - ClipSampler, if given only the sampled clips are decoded (seeking past the rest) and
+                         iteration yields (clip, reference, start_time) tuples. batch_size is ignored, frame
+                         sampling is set by the ClipSampler (frame_filter, take_every_nth and target_fps raise).
+          index_dir - directory where keyframe indices of videos are built once and kept between runs, used to seek to
+                      exact keyframes with clip_sampler or a num_frames frame_budget (None = no indices, seek when the
+                      next clip or frame is far enough ahead).
+          frame_filter - FrameFilter which drops near-duplicate frames, info["frame_indices"] then holds the original
+                         indices of the kept frames.
+          output_transform - OutputTransform applied in the workers (layout, dtype, normalization). None = uint8 HWC.
+          ordered - yield videos in input order (videos which fail are left out), workers take videos in input order.
+          reorder_window - with ordered, max number of videos read ahead of the one that's next in order.
+          autoscaler - Autoscaler which adds and parks workers while reading, workers is then the initial number.
+          dedup_inputs - read duplicate videos (same canonical link or path) once and yield the result for every one of
+                         their refs (outputs of duplicates share the frames array). With ordered, every ref is still
+                         yielded at its own input position, duplicates more than reorder_window positions after
+                         the first one are read again so frames are never kept longer than the window.
+          dedup_hash_bytes - with dedup_inputs, also treat local files with equal size and equal first
+                             dedup_hash_bytes bytes as duplicates (0 = only compare names).
+          frame_budget - FrameBudget, stops decoding a video after max_frames kept frames or max_duration seconds, or
+                         takes num_frames uniformly spaced frames (info["frame_indices"] then holds their indices and
+                         info["budget_met"] is False if fewer came out because the video is shorter than probed).
         """
         self.n_vids = len(vids)
         self.n_workers = workers
+        self.clip_sampler = clip_sampler
+        self.ordered = ordered
+        self.autoscaler = autoscaler
+        self.consumer_wait = 0.0  # total seconds spent waiting for workers
+        self.released = False
+        if clip_sampler is not None:
+            batch_size = -1  # every clip is put on the queue as its own frame sequence
+        if index_dir is not None and clip_sampler is None and (frame_budget is None or frame_budget.num_frames is None):
+            raise ValueError("index_dir is only used with clip_sampler or a num_frames frame_budget")
+        if clip_sampler is not None and (frame_filter is not None or take_every_nth != 1 or target_fps != -1):
+            raise ValueError("frame_filter, take_every_nth and target_fps aren't supported with clip sampling")
+        if frame_budget is not None and clip_sampler is not None:
+            raise ValueError("clip sampling already bounds the frames per video, frame_budget isn't supported with it")
+        if (ordered or autoscaler is not None) and clip_sampler is not None:
+            raise ValueError("ordered mode and autoscaling aren't supported with clip sampling")
+        if ordered and any(is_archive(vid) for vid in vids):
+            raise ValueError("ordered mode isn't supported with archive inputs")
+
+        n_procs = workers
+        if autoscaler is not None:
+            self.n_workers = min(max(workers, autoscaler.min_workers), autoscaler.max_workers)
+            n_procs = autoscaler.max_workers  # extra workers are only started when needed
 
         if refs is None:
             refs = list(range(self.n_vids))
         vid_refs = list(zip(vids, refs))
 
-        random.shuffle(vid_refs)  # shuffle videos so each shard has approximately equal sum of video lengths
+        group_ids = list(range(self.n_vids))  # index of the video every input is read as
+        self.ref_groups = None  # references of all duplicates of a video
+        if dedup_inputs:
+            unique_vids, group_ids = dedup(vid_refs, dedup_hash_bytes)
+            print(f"Found {len(unique_vids)} unique videos among {self.n_vids} inputs")
+            if ordered:  # frames are kept until the last duplicate is yielded, far duplicates are read again
+                unique_vids, group_ids = split_far_duplicates(unique_vids, group_ids, reorder_window)
+            self.ref_groups = [[] for _ in unique_vids]
+            for group_id, ref in zip(group_ids, refs):
+                self.ref_groups[group_id].append(ref)
+            vid_refs = [(vid, group_id) for group_id, vid in enumerate(unique_vids)]
+
+        self.pending = []  # outputs ready to be yielded
+        self.scheduler = None
+        self.order = list(zip(group_ids, refs))  # with ordered, (video index, reference) of every output position
+        self.last_pos = {index: pos for pos, (index, _) in enumerate(self.order)}  # last output position of a video
+        self.out_pos = 0  # next output position
+        self.reorder_buffer = {}  # index -> (frames, info) of videos read before their turn, kept until last use
+        self.skipped = set()
+        if not ordered:
+            random.shuffle(vid_refs)  # shuffle videos so each shard has approximately equal sum of video lengths
+        if ordered or autoscaler is not None:
+            window = reorder_window if ordered else None
+            self.scheduler = Scheduler(vid_refs, window, ordered, self.n_workers)
+            vid_refs = []  # workers take videos from the scheduler
+
+        if output_transform is None:
+            output_transform = OutputTransform()
+        frame_shape = output_transform.frame_shape(resize_size)
+        frame_bytes = resize_size**2 * 3 * output_transform.dtype.itemsize
 
         memory_size_b = int(memory_size * 1024**3)  # GB -> bytes
-        shared_blocks = memory_size_b // (resize_size**2 * 3 * (1 if batch_size == -1 else batch_size))
+        shared_blocks = memory_size_b // (frame_bytes * (1 if batch_size == -1 else batch_size))
         dim12 = (shared_blocks,) if batch_size == -1 else (shared_blocks, batch_size)
-        self.shared_queue = SharedQueue.from_shape(*dim12, resize_size, resize_size, 3, timeout=60.0, retry=True)
+        self.shared_queue = SharedQueue.from_shape(
+            *dim12, *frame_shape, dtype=output_transform.dtype, timeout=60.0, retry=True
+        )
 
         div_vids = [
-            vid_refs[int(self.n_vids * i / workers) : int(self.n_vids * (i + 1) / workers)] for i in range(workers)
+            vid_refs[int(len(vid_refs) * i / n_procs) : int(len(vid_refs) * (i + 1) / n_procs)] for i in range(n_procs)
         ]
 
+        if clip_sampler is None:
+            worker_args = [
+                (
+                    work,
+                    worker_id,
+                    take_every_nth,
+                    target_fps,
+                    resize_size,
+                    batch_size,
+                    self.shared_queue.export(),
+                    frame_filter,
+                    output_transform,
+                    self.scheduler,
+                    frame_budget,
+                    index_dir,
+                )
+                for worker_id, work in enumerate(div_vids)
+            ]
+        else:
+            worker_args = [
+                (work, worker_id, clip_sampler, resize_size, self.shared_queue.export(), index_dir, output_transform)
+                for worker_id, work in enumerate(div_vids)
+            ]
+
         self.procs = [
             multiprocessing.Process(
-                args=(work, worker_id, take_every_nth, target_fps, resize_size, batch_size, self.shared_queue.export()),
+                args=args,
                 daemon=True,
-                target=read_vids,
+                target=read_vids if clip_sampler is None else read_clips,
             )
-            for worker_id, work in enumerate(div_vids)
+            for args in worker_args
         ]
 
     def __len__(self):
@@ -70,27 +188,158 @@ class FrameReader:
         return self
 
     def __next__(self):
-        while not self.shared_queue and any(p.is_alive() for p in self.procs):
-            time.sleep(1)  # SharedQueue is empty but processes are alive
-        if self.shared_queue:
-            frames, info = self.shared_queue.get()
-            return frames, info
+        self._autoscale()
+        while True:
+            alive = any(p.is_alive() for p in self.procs)  # checked before polling so no last frames get missed
+            item = self._poll(flush=not alive)
+            if item is not None:
+                return item
+            if not alive:
+                break
+            # SharedQueue is empty (or next video in order isn't read yet) but processes are alive
+            self._wait(POLL_INTERVAL)
 
         self.finish_reading()
         self.release_memory()
         raise StopIteration
 
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """
+        Same as __next__ but waits for frames without blocking the event loop.
+        Cancelling the awaiting task stops the workers and releases the shared memory.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            self._autoscale()
+            alive = any(p.is_alive() for p in self.procs)  # checked before polling so no last frames get missed
+            poll = asyncio.ensure_future(loop.run_in_executor(None, self._poll, not alive))
+            try:
+                # shielded so a cancelled consumer can't release the memory while poll is still copying from it
+                item = await asyncio.shield(poll)
+                if item is not None:
+                    return item
+                if not alive:
+                    break
+                t_wait = time.perf_counter()
+                await asyncio.sleep(POLL_INTERVAL)  # SharedQueue is empty but processes are alive
+                self.consumer_wait += time.perf_counter() - t_wait
+            except asyncio.CancelledError:
+                await asyncio.wait([poll])
+                self.stop_reading()
+                raise
+
+        self.finish_reading()
+        self.release_memory()
+        raise StopAsyncIteration
+
+    async def __aenter__(self):
+        self.start_reading()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if not self.released:  # left early (break, exception or cancellation in the loop body)
+            self.stop_reading()
+
+    def _poll(self, flush=False):
+        """returns next output or None if SharedQueue is empty (blocking manager calls, run in executor)"""
+        if not self.pending:
+            if self.ordered:
+                self._poll_ordered(flush)
+            elif self.shared_queue:
+                self.pending.extend(self._outputs(*self.shared_queue.get()))
+        return self.pending.pop(0) if self.pending else None
+
+    def _poll_ordered(self, flush=False):
+        """
+        Moves everything from SharedQueue to the reorder buffer until the video of the next output position is there
+        and moves its output to pending. flush - workers are done, don't wait for videos which never arrived.
+        """
+        while self.out_pos < len(self.order):
+            self.skipped.update(self.scheduler.skipped())
+            index, ref = self.order[self.out_pos]
+            if index in self.reorder_buffer or index in self.skipped:
+                if index in self.reorder_buffer:
+                    frames, info = self.reorder_buffer[index]
+                    self.pending.append(self._output(frames, dict(info, reference=ref)))
+                if self.last_pos[index] == self.out_pos:  # no later duplicates
+                    self.reorder_buffer.pop(index, None)
+                    self.skipped.discard(index)
+                self.out_pos += 1
+                # videos are indexed by first occurrence, this lets workers start the video window positions ahead
+                self.scheduler.head.value = max(self.scheduler.head.value, index + 1)
+                if self.pending:
+                    return
+            elif self.shared_queue:
+                frames, info = self.shared_queue.get()
+                self.reorder_buffer[info["index"]] = (frames, info)
+            elif flush:
+                self.skipped.add(index)  # worker died without reporting it
+            else:
+                return
+
+    def _wait(self, seconds):
+        t_wait = time.perf_counter()
+        time.sleep(seconds)
+        self.consumer_wait += time.perf_counter() - t_wait
+        self._autoscale()
+
+    def _autoscale(self):
+        """Adds or parks workers if the autoscaler decides so"""
+        if self.autoscaler is None or self.released:
+            return
+        active = self.scheduler.active_workers.value
+        target = self.autoscaler(active, self.consumer_wait, self.scheduler.stall_time.value)
+        if target is None or target == active:
+            return
+        self.scheduler.active_workers.value = target
+        for p in self.procs[:target]:
+            if p.pid is None:  # never started
+                p.start()
+
+    def _output(self, frames, info):
+        if self.clip_sampler is not None:
+            return frames, info["reference"], info["start_time"]
+        return frames, info
+
+    def _outputs(self, frames, info):
+        """returns outputs of an item from SharedQueue, one for every duplicate of the video"""
+        if self.ref_groups is None:
+            return [self._output(frames, info)]
+        return [self._output(frames, dict(info, reference=ref)) for ref in self.ref_groups[info["reference"]]]
+
     def start_reading(self):
-        print(f"Reading {self.n_vids} videos using {self.n_workers} workers...")
+        if self.autoscaler is None:
+            print(f"Reading {self.n_vids} videos using {self.n_workers} workers...")
+        else:
+            bounds = f"{self.autoscaler.min_workers}-{self.autoscaler.max_workers}"
+            print(f"Reading {self.n_vids} videos using {self.n_workers} workers (autoscaling {bounds})...")
+            self.autoscaler.reset()
         self.t0 = time.perf_counter()
-        for p in self.procs:
+        for p in self.procs[: self.n_workers]:
             p.start()
 
     def finish_reading(self):
         for p in self.procs:
-            p.join()
+            if p.pid is not None:
+                p.join()
         print(f"All jobs completed in {time.perf_counter() - self.t0}[s].")
 
+    def stop_reading(self):
+        """Stops workers before they're done and releases shared memory"""
+        if self.released:
+            return
+        for p in self.procs:
+            if p.is_alive():
+                p.terminate()
+            if p.pid is not None:
+                p.join()
+        self.release_memory()
+        print(f"Reading stopped after {time.perf_counter() - self.t0}[s].")
+
     def release_memory(self):
         self.shared_queue.data_mem.unlink()
         self.shared_queue.data_mem.close()
+        self.released = True
@@ -0,0 +1,149 @@
+"""keyframe index - keyframe positions and frame timestamps of a video for random access"""
+import bisect
+import cv2
+import hashlib
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+
+class KeyframeIndex:
+    """
+    Positions of keyframes and presentation timestamps of all frames in a video
+    """
+
+    def __init__(self, keyframes, pts, fps, version=""):
+        """
+        Input:
+          keyframes - sorted list of frame indices which are keyframes.
+          pts - presentation timestamp of every frame in milliseconds.
+          fps - frame rate of the video.
+          version - identifies the content the index was built from (see source_version).
+        """
+        self.keyframes = [int(k) for k in keyframes]
+        self.pts = np.asarray(pts, dtype=np.float64)
+        self.fps = float(fps)
+        self.version = str(version)
+
+    @property
+    def frame_count(self):
+        return len(self.pts)
+
+    @classmethod
+    def build(cls, load_vid):
+        """
+        Builds index with a decode pass over the video (frames are decoded but never converted or copied), so frame
+        count and timestamps are the ones readers see. Containers can hold more packets than decodable frames, so
+        keyframes come from a demux-only pass and are matched to frames by timestamp.
+        Returns None if the video can't be read.
+        """
+        cap = cv2.VideoCapture(load_vid)  # pylint: disable=I1101
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not cap.isOpened() or fps <= 0:
+            return None
+        pts = []
+        while cap.grab():
+            pts.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        if len(pts) == 0:
+            return None
+
+        cap = cv2.VideoCapture(load_vid)  # pylint: disable=I1101
+        key_pts = [0.0]
+        if cap.isOpened() and cap.set(cv2.CAP_PROP_FORMAT, -1):  # -1 = raw packets
+            while cap.grab():
+                if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    key_pts.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        half_frame = 500.0 / fps  # keyframe timestamps are matched to the closest frame
+        keyframes = np.searchsorted(pts, np.array(key_pts) - half_frame)
+        keyframes = sorted({int(k) for k in keyframes if k < len(pts)})
+        return cls(keyframes, pts, fps)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            version = data["version"].item() if "version" in data.files else ""
+            return cls(data["keyframes"], data["pts"], data["fps"], version)
+
+    def save(self, path):
+        with open(path, "wb") as f:  # np.savez would append .npz to the path
+            keyframes = np.array(self.keyframes, dtype=np.int64)
+            np.savez(f, keyframes=keyframes, pts=self.pts, fps=self.fps, version=np.array(self.version))
+
+    def nearest_keyframe(self, frame):
+        """Returns the last keyframe at or before frame (decoding has to start there to reach frame)"""
+        return self.keyframes[max(bisect.bisect_right(self.keyframes, frame) - 1, 0)]
+
+    def frame_at(self, time_ms):
+        """Returns the index of the frame shown at time_ms"""
+        return max(int(np.searchsorted(self.pts, time_ms, side="right")) - 1, 0)
+
+
+def index_path(vid, index_dir):
+    return os.path.join(index_dir, hashlib.sha1(vid.encode("utf-8")).hexdigest() + ".idx")
+
+
+def source_version(src, load_vid, resize_size=None):
+    """
+    Identifies the content an index is built from, so indices of replaced files or other streams get rebuilt.
+
+    Input:
+      src - path of the video or of the archive it's in, or its link.
+      load_vid - variable used to load video.
+      resize_size - target frame size, picks the stream links are read from.
+    """
+    if src.startswith("http://") or src.startswith("https://"):
+        version = f"resize_size={resize_size}"
+        if os.path.isfile(load_vid):  # downloaded file
+            version += f" size={os.path.getsize(load_vid)}"
+        return version
+    try:
+        stat = os.stat(src)
+    except OSError:
+        return ""
+    return f"size={stat.st_size} mtime={stat.st_mtime_ns}"
+
+
+def get_index(vid, load_vid, index_dir=None, version=""):
+    """
+    Loads index of vid from index_dir, or builds it (and saves it there if index_dir is given).
+    A saved index built from a different version of the video is rebuilt.
+
+    Input:
+      vid - path or link of the video (identifies the video in index_dir).
+      load_vid - variable used to load video.
+      index_dir - directory with index sidecar files (None = don't persist).
+      version - identifies the content of the video (see source_version).
+    """
+    if index_dir is not None and os.path.exists(index_path(vid, index_dir)):
+        try:
+            index = KeyframeIndex.load(index_path(vid, index_dir))
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):  # replaced or corrupt, rebuild it
+            index = None
+        if index is not None and index.version == version:
+            return index
+
+    index = KeyframeIndex.build(load_vid)
+    if index is not None:
+        index.version = version
+    if index is not None and index_dir is not None:
+        save_index(index, vid, index_dir)
+    return index
+
+
+def save_index(index, vid, index_dir):
+    """Saves index of vid to index_dir, failures are only reported as the index can be rebuilt"""
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=index_dir)  # unique per writer
+        os.close(fd)
+    except OSError as e:
+        print(f"Warning: keyframe index of {vid} not saved - {e}")
+        return
+    try:
+        index.save(tmp_path)
+        os.replace(tmp_path, index_path(vid, index_dir))  # atomic so readers never see half written indices
+    except OSError as e:
+        print(f"Warning: keyframe index of {vid} not saved - {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
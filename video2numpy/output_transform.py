@@ -0,0 +1,58 @@
+"""output transform - converts uint8 HWC frames into model ready arrays"""
+import numpy as np
+
+
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class OutputTransform:
+    """
+    Class for converting layout, dtype and normalizing frames in one vectorized pass
+    """
+
+    def __init__(self, layout="HWC", dtype="uint8", mean=None, std=None):
+        """
+        Input:
+          layout - "HWC" or "CHW", layout of every output frame.
+          dtype - "uint8", "float16" or "float32". Float outputs are scaled to [0, 1] before normalization.
+          mean - per channel (RGB) mean subtracted from float outputs (None = 0).
+          std - per channel (RGB) std float outputs are divided by (None = 1).
+        """
+        if layout not in ("HWC", "CHW"):
+            raise ValueError(f"Unknown layout {layout}")
+        if dtype not in ("uint8", "float16", "float32"):
+            raise ValueError(f"Unsupported dtype {dtype}")
+        if dtype == "uint8" and (mean is not None or std is not None):
+            raise ValueError("Normalization needs a float dtype")
+
+        self.layout = layout
+        self.dtype = np.dtype(dtype)
+
+        mean = np.zeros(3) if mean is None else np.asarray(mean, dtype=np.float64)
+        std = np.ones(3) if std is None else np.asarray(std, dtype=np.float64)
+        # (x / 255 - mean) / std == x * scale + bias
+        self.scale = (1.0 / (255.0 * std)).astype(self.dtype)
+        self.bias = (-mean / std).astype(self.dtype)
+
+    def frame_shape(self, size):
+        return (size, size, 3) if self.layout == "HWC" else (3, size, size)
+
+    def __call__(self, frames):
+        """
+        Input:
+          frames - uint8 RGB array of shape (..., H, W, 3).
+
+        Output:
+          transformed frames of shape (..., H, W, 3) or (..., 3, H, W). CHW output is a transposed view, the copy into
+          the shared queue lays it out contiguously.
+        """
+        if self.dtype != np.uint8:
+            frames = frames.astype(self.dtype)
+            frames *= self.scale
+            frames += self.bias
+        if self.layout == "CHW":
+            frames = np.moveaxis(frames, -1, -3)
+        return frames
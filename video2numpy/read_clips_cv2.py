@@ -0,0 +1,140 @@
+"""uses opencv to read randomly sampled clips from video."""
+import cv2
+import time
+import numpy as np
+import random
+
+from .archive import exit_on_sigterm, iter_videos, member_dst_name
+from .keyframe_index import get_index, source_version
+from .resizer import Resizer
+from .shared_queue import SharedQueue
+from .utils import handle_url
+
+
+SEEK_AHEAD = 128  # without a keyframe index seek if the next clip starts further than this many frames ahead
+
+
+def read_clips(vid_refs, worker_id, clip_sampler, resize_size, queue_export, index_dir=None, output_transform=None):
+    """
+    Reads clips sampled by clip_sampler from list of videos, saves them to Shared Queue
+
+    Input:
+      vid_refs - list of videos (path, youtube link or tar/zip archive of videos) and their references
+      worker_id - unique ID of worker
+      clip_sampler - ClipSampler which decides which clips to take from each video
+      resize_size - new pixel height and width of resized frame
+      queue_export - SharedQueue export used re-create SharedQueue object in worker
+      index_dir - directory to load/save keyframe indices from/to, they're built with a decode pass over the video
+                  (streams included) the first time it's read. None = no indices, seek by SEEK_AHEAD.
+      output_transform - OutputTransform applied to clips before putting them on the queue (None = uint8 HWC)
+    """
+    exit_on_sigterm()
+    queue = SharedQueue.from_export(*queue_export)
+    t0 = time.perf_counter()
+    print(f"Worker #{worker_id} starting sampling clips from {len(vid_refs)} videos")
+
+    def get_clips(vid, ref, name, src, member=None):
+        """
+        name - identifies the video for clip sampling and keyframe indices (vid, or archive/member)
+        src - path or link of the video or the archive it's in
+        """
+        if vid.startswith("http://") or vid.startswith("https://"):
+            load_vid, file, dst_name = handle_url(vid, resize_size=resize_size)
+        elif member is not None:  # vid is a temporary copy of an archive member
+            load_vid, file, dst_name = vid, None, member_dst_name(member)
+        else:
+            load_vid, file, dst_name = vid, None, vid[:-4].split("/")[-1] + ".npy"
+
+        cap = cv2.VideoCapture(load_vid)  # pylint: disable=I1101
+        if not cap.isOpened():
+            print(f"Error: {name} not opened")
+            return
+
+        index = None
+        if index_dir is not None:
+            index = get_index(name, load_vid, index_dir, source_version(src, load_vid, resize_size))
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if index is None else index.frame_count
+        width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        resizer = Resizer([height, width, 3], resize_size)
+
+        starts = clip_sampler(name, frame_count)
+        if len(starts) == 0:
+            print(f"Warning: {name} is shorter than a single clip")
+
+        def count_frames(known):
+            """Returns the real frame count by reading forward from the known frames (seeking past the end failed)"""
+            if not cap.set(cv2.CAP_PROP_POS_FRAMES, known):
+                return known
+            while cap.grab():
+                known += 1
+            return known
+
+        pos = 0  # index of the frame the next grab() returns
+        known = 0  # number of frames known to be decodable
+        real_count = None  # set once the header turned out to over-report the frame count
+        done = []
+        while starts:
+            start = starts.pop(0)
+            sought = False  # seeked and nothing was read after it yet
+            if start < pos:  # overlaps the previous clip
+                seek = True
+            elif index is not None:  # only seek if there's a keyframe to jump to between here and the clip
+                seek = index.nearest_keyframe(start) > pos
+            else:
+                seek = start - pos > SEEK_AHEAD
+            if seek:
+                if cap.set(cv2.CAP_PROP_POS_FRAMES, start):
+                    pos, sought = start, True
+                elif start < pos:
+                    continue  # overlaps the previous clip and the source can't seek back
+
+            clip_frames = []
+            while pos < start + clip_sampler.span:
+                if not cap.grab():
+                    break
+                sought = False
+                if pos >= start and (pos - start) % clip_sampler.frame_stride == 0:
+                    _, frame = cap.retrieve()
+                    clip_frames.append(resizer(frame))
+                pos += 1
+            known = max(known, pos)
+
+            if len(clip_frames) < clip_sampler.clip_length:
+                if real_count is not None:  # failed although the clip fits, give up on this video
+                    break
+                # frame count over-estimated, redraw the clips past the real end
+                real_count = count_frames(known) if sought else pos
+                starts = [s for s in clip_sampler(name, real_count) if s not in done]
+                continue
+            done.append(start)
+
+            info = {
+                "reference": ref,
+                "dst_name": dst_name,
+                "start_time": start / fps,
+                "pad_by": 0,
+            }
+            np_clip = np.array(clip_frames)[:, :, :, ::-1]  # BGR to RGB conversion
+            if output_transform is not None:
+                np_clip = output_transform(np_clip)
+            queue.put(np_clip, info)
+
+        if file is not None:  # for python files that need to be closed
+            file.close()
+
+    random.Random(worker_id).shuffle(vid_refs)
+    for vid, ref in vid_refs:
+        try:
+            for load_vid, member in iter_videos(vid):  # archives are read member by member
+                name = vid if member is None else f"{vid}/{member}"
+                try:
+                    get_clips(load_vid, ref, name, vid, member)
+                except Exception as e:  # pylint: disable=broad-except
+                    print(f"Error: Video {name} failed with message - {e}")
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Error: Archive {vid} failed with message - {e}")
+    tf = time.perf_counter()
+    print(f"Worker #{worker_id} done sampling clips from {len(vid_refs)} videos in {tf-t0}[s]")
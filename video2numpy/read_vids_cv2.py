@@ -4,6 +4,9 @@ import time
 import numpy as np
 import random
 
+from .archive import exit_on_sigterm, iter_videos, member_dst_name
+from .keyframe_index import get_index, source_version
+from .read_clips_cv2 import SEEK_AHEAD
 from .resizer import Resizer
 from .shared_queue import SharedQueue
 from .utils import handle_url
@@ -12,26 +15,53 @@ from .utils import handle_url
 MAX_RETRY = 2  # TODO: do this better, maybe param for this
 
 
-def read_vids(vid_refs, worker_id, take_every_nth, target_fps, resize_size, batch_size, queue_export):
+def read_vids(
+    vid_refs,
+    worker_id,
+    take_every_nth,
+    target_fps,
+    resize_size,
+    batch_size,
+    queue_export,
+    frame_filter=None,
+    output_transform=None,
+    scheduler=None,
+    frame_budget=None,
+    index_dir=None,
+):
     """
     Reads list of videos, saves frames to Shared Queue
 
     Input:
-      vid_refs - list of videos (either path or youtube link) and their references
+      vid_refs - list of videos (path, youtube link or tar/zip archive of videos) and their references
       worker_id - unique ID of worker
       target_fps - what fps to decode the videos at (-1 means unaltered fps)
       resize_size - new pixel height and width of resized frame
       batch_size - max length of frame sequence to put on shared_queue (-1 = no max).
       queue_export - SharedQueue export used re-create SharedQueue object in worker
+      frame_filter - FrameFilter used to drop redundant frames (None = keep all sampled frames)
+      output_transform - OutputTransform applied to frames before putting them on the queue (None = uint8 HWC)
+      scheduler - Scheduler to take videos from instead of vid_refs, info["index"] is then the index of the video
+      frame_budget - FrameBudget bounding how much of every video is decoded (None = read videos to the end)
+      index_dir - directory with keyframe indices of local videos, used to seek to num_frames budget frames (None = seek
+                  by SEEK_AHEAD), building one counts towards the timeout
     """
+    exit_on_sigterm()
     queue = SharedQueue.from_export(*queue_export)
     t0 = time.perf_counter()
-    print(f"Worker #{worker_id} starting processing {len(vid_refs)} videos")
-
-    def get_frames(vid, ref, retry=0):
+    if scheduler is None:
+        print(f"Worker #{worker_id} starting processing {len(vid_refs)} videos")
+    else:
+        print(f"Worker #{worker_id} starting processing scheduled videos")
+
+    def get_frames(vid, ref, retry=0, index=None, member=None, src=None):
+        """src - path or link of the video or the archive it's in (None = vid)"""
+        src = vid if src is None else src
         # TODO: better way of testing if vid is url
         if vid.startswith("http://") or vid.startswith("https://"):
-            load_vid, file, dst_name = handle_url(vid, retry)
+            load_vid, file, dst_name = handle_url(vid, retry, resize_size)
+        elif member is not None:  # vid is a temporary copy of an archive member
+            load_vid, file, dst_name = vid, None, member_dst_name(member)
         else:
             load_vid, file, dst_name = vid, None, vid[:-4].split("/")[-1] + ".npy"
 
@@ -55,61 +85,136 @@ def read_vids(vid_refs, worker_id, take_every_nth, target_fps, resize_size, batc
 
         if not cap.isOpened():
             print(f"Error: {vid} not opened")
-            return
+            return False
 
         width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
         height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
         frame_shape = [height, width, 3]
 
         resizer = Resizer(frame_shape, resize_size)
-
-        ret = True
+        if frame_filter is not None:
+            frame_filter.reset()
+        frame_indices = []
+
+        stop_ind = None  # index of the first frame that isn't read anymore
+        targets = None  # indices of frames to take, None = every skip_frames-th frame
+        kf_index = None  # keyframe index, only used to seek between targets
+        if frame_budget is not None:
+            stop_ind = frame_budget.stop_frame(fps)
+            if frame_budget.num_frames is not None:
+                # building an index of a link means streaming all of it just to take a few frames
+                if index_dir is not None and not (src.startswith("http://") or src.startswith("https://")):
+                    name = src if member is None else f"{src}/{member}"
+                    kf_index = get_index(name, load_vid, index_dir, source_version(src, load_vid, resize_size))
+                if kf_index is not None:
+                    frame_count = kf_index.frame_count
+                targets = frame_budget.uniform_indices(frame_count, fps)
+                stop_ind = targets[-1] + 1 if targets else 0
+        n_taken = 0
+
+        can_seek = True
+        seek_from = None  # position before the last seek, until a frame was read after it
         ind = 0
-        while ret:
-            ret = cap.grab()
+        while True:
+            if stop_ind is not None and ind >= stop_ind:
+                break
+            if frame_budget is not None and frame_budget.full(len(video_frames)):
+                break
+            if targets is not None and can_seek:
+                if kf_index is not None:  # only seek if there's a keyframe to jump to before the target
+                    seek = kf_index.nearest_keyframe(targets[n_taken]) > ind
+                else:
+                    seek = targets[n_taken] - ind > SEEK_AHEAD
+                if seek and cap.set(cv2.CAP_PROP_POS_FRAMES, targets[n_taken]):
+                    seek_from, ind = ind, targets[n_taken]
+                elif seek:
+                    can_seek = False  # source can't seek, grab forward instead
+            if not cap.grab():
+                if seek_from is not None and cap.set(cv2.CAP_PROP_POS_FRAMES, seek_from):
+                    can_seek, seek_from, ind = False, None, seek_from  # sought past the real end, read forward
+                    continue
+                break
+            seek_from = None
             if time.time() - time_0 > timeout:  # timeout if taking too long (maybe try another format)
                 raise TimeoutError
-            if ret and (ind % skip_frames == 0):
+            take = ind % skip_frames == 0 if targets is None else ind == targets[n_taken]
+            if take:
+                n_taken += 1
                 ret, frame = cap.retrieve()
-                frame = resizer(frame)
-                video_frames.append(frame)
+                if not ret:
+                    break
+                if frame_filter is None or frame_filter(frame):
+                    video_frames.append(resizer(frame))
+                    frame_indices.append(ind)
             ind += 1
 
         if len(video_frames) == 0:
             print(f"Warning: {vid} contained 0 frames")
-            return
+            return False
 
         np_frames = np.array(video_frames)[:, :, :, ::-1]  # BGR to RGB conversion
+        if output_transform is not None:
+            np_frames = output_transform(np_frames)
         f_ct = np_frames.shape[0]
         pad_by = 0
-        if batch_size != -1:
+        if batch_size != -1:  # pad after the transform so padding frames are zeros in the output dtype
             pad_by = (batch_size - f_ct % batch_size) % batch_size
             np_frames = np.pad(np_frames, ((0, pad_by), (0, 0), (0, 0), (0, 0)))
-            np_frames = np_frames.reshape((-1, batch_size, resize_size, resize_size, 3))
+            np_frames = np_frames.reshape((-1, batch_size, *np_frames.shape[1:]))
 
         info = {
             "reference": ref,
             "dst_name": dst_name,
             "pad_by": pad_by,
         }
+        if frame_filter is not None or targets is not None:
+            info["frame_indices"] = frame_indices
+        if targets is not None:  # False if the video turned out shorter than its probed frame count
+            info["budget_met"] = n_taken == frame_budget.num_frames
+        if index is not None:
+            info["index"] = index
+        if member is not None:
+            info["member"] = member
+        t_put = time.perf_counter()
         queue.put(np_frames, info)
+        if scheduler is not None:
+            scheduler.add_stall(time.perf_counter() - t_put)
 
         if file is not None:  # for python files that need to be closed
             file.close()
+        return True
+
+    if scheduler is None:
+        random.Random(worker_id).shuffle(vid_refs)
+        tasks = ((None, vid, ref) for vid, ref in vid_refs)
+    else:
+        tasks = scheduler.tasks(worker_id)
 
-    random.Random(worker_id).shuffle(vid_refs)
-    for vid, ref in vid_refs:
+    def get_frames_retry(vid, ref, index, member, src):
+        name = vid if member is None else member
         retry = 0
         while retry < MAX_RETRY:
             try:
-                get_frames(vid, ref, retry)
-                break
+                return get_frames(vid, ref, retry, index, member, src)
             except TimeoutError as _:
-                print(f"TimeoutError: {vid} timed out")
+                print(f"TimeoutError: {name} timed out")
                 retry += 1
             except Exception as e:  # pylint: disable=broad-except
-                print(f"Error: Video {vid} failed with message - {e}")
+                print(f"Error: Video {name} failed with message - {e}")
                 break
             print("retrying...")
+        return False
+
+    n_vids = 0
+    for index, vid, ref in tasks:
+        done = False
+        try:
+            for load_vid, member in iter_videos(vid):  # archives are read member by member
+                n_vids += 1
+                done = get_frames_retry(load_vid, ref, index, member, vid) or done
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Error: Archive {vid} failed with message - {e}")
+        if not done and scheduler is not None:
+            scheduler.skip(index)
     tf = time.perf_counter()
-    print(f"Worker #{worker_id} done processing {len(vid_refs)} videos in {tf-t0}[s]")
+    print(f"Worker #{worker_id} done processing {n_vids} videos in {tf-t0}[s]")
@@ -26,7 +26,7 @@ def read_vids(vids, worker_id, take_every_nth, resize_size, batch_size, queue_ex
     def get_frames(vid):
         # TODO: better way of testing if vid is url
         if vid.startswith("http://") or vid.startswith("https://"):
-            load_vid, file, dst_name = handle_url(vid)
+            load_vid, file, dst_name = handle_url(vid, resize_size=resize_size)
         else:
             load_vid, file, dst_name = vid, None, vid[:-4].split("/")[-1] + ".npy"
 
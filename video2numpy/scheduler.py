@@ -0,0 +1,67 @@
+"""scheduler - hands out videos to workers on demand"""
+import multiprocessing
+import queue
+import time
+
+
+class Scheduler:
+    """
+    Shared between workers, gives out videos in input order so the oldest unfinished video is always worked on first.
+    With a window workers don't start videos more than window positions ahead of the consumer.
+    Workers with worker_id >= active_workers are parked and don't take new videos.
+    """
+
+    def __init__(self, vid_refs, window=None, ordered=False, active_workers=1):
+        """
+        Input:
+          vid_refs - list of (video, reference) pairs in the order they should be read.
+          window - max distance between the next video the consumer needs and any video being read (None = no limit).
+          ordered - consumer yields videos in order, so it needs to know about videos which won't produce output.
+          active_workers - number of workers allowed to take videos.
+        """
+        self.vid_refs = vid_refs
+        self.window = window
+        self.ordered = ordered
+        self.next_task = multiprocessing.Value("q", 0)  # index of the next video to hand out
+        self.head = multiprocessing.Value("q", 0)  # index of the next video the consumer needs
+        self.skipped_queue = multiprocessing.Queue()  # indices of videos which won't produce any output
+        self.active_workers = multiprocessing.Value("i", active_workers)
+        self.stall_time = multiprocessing.Value("d", 0.0)  # total seconds workers waited to put frames
+
+    def __len__(self):
+        return len(self.vid_refs)
+
+    def tasks(self, worker_id=0):
+        """Worker side, yields (index, video, reference) until all videos are handed out"""
+        while True:
+            while worker_id >= self.active_workers.value and self.next_task.value < len(self.vid_refs):
+                time.sleep(0.1)  # parked
+            with self.next_task.get_lock():
+                index = self.next_task.value
+                if index >= len(self.vid_refs):
+                    return
+                self.next_task.value += 1
+
+            while self.window is not None and index >= self.head.value + self.window:
+                time.sleep(0.01)  # consumer is too far behind, wait for it to catch up
+            vid, ref = self.vid_refs[index]
+            yield index, vid, ref
+
+    def skip(self, index):
+        """Worker side, tells the consumer not to wait for video index"""
+        if self.ordered:
+            self.skipped_queue.put(index)
+
+    def add_stall(self, seconds):
+        """Worker side, records time spent waiting for space on the SharedQueue"""
+        with self.stall_time.get_lock():
+            self.stall_time.value += seconds
+
+    def skipped(self):
+        """Consumer side, returns indices skipped since last call"""
+        indices = []
+        while True:
+            try:
+                indices.append(self.skipped_queue.get_nowait())
+            except queue.Empty:
+                return indices
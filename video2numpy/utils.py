@@ -4,26 +4,81 @@ import tempfile
 import yt_dlp
 
 
-QUALITY = "360p"
+QUALITY = 360  # short side of the stream to download when the target size isn't known
+CODEC_PREFERENCE = ["avc1", "h264", "vp9", "vp09", "av01"]  # cheapest to decode first
+PROTOCOL_PREFERENCE = ["https", "http"]  # direct downloads before fragmented ones (m3u8, dash)
 
-# TODO make this better / audio support
-def get_format_selector(retry):
+
+def _preference(value, preferences):
+    for i, pref in enumerate(preferences):
+        if value.startswith(pref):
+            return i
+    return len(preferences)
+
+
+def _short_side(f):
+    return min(f["height"], f.get("width") or f["height"])
+
+
+def _cost(f):
+    """(codec, protocol, bitrate), lower is cheaper to download and decode"""
+    bitrate = f.get("vbr") or f.get("tbr") or float("inf")
+    codec = _preference(f.get("vcodec") or "", CODEC_PREFERENCE)
+    protocol = _preference(f.get("protocol") or "", PROTOCOL_PREFERENCE)
+    return codec, protocol, bitrate
+
+
+def rank_formats(formats, min_side):
+    """
+    Sorts video formats from best to worst for reading frames of size min_side:
+    smallest stream whose short side is at least min_side first, then cheaper codecs, then lower bitrates.
+    Streams smaller than min_side come last, largest first. Video-only streams are preferred as audio is unused.
+    """
+    video = [f for f in formats if (f.get("vcodec") or "") != "none" and f.get("height")]
+    video_only = [f for f in video if f.get("acodec") == "none"] or video
+
+    big_enough = [f for f in video_only if _short_side(f) >= min_side]
+    too_small = [f for f in video_only if _short_side(f) < min_side]
+    return sorted(big_enough, key=lambda f: (_short_side(f), *_cost(f))) + sorted(
+        too_small, key=lambda f: (-_short_side(f), *_cost(f))
+    )
+
+
+def fallback_formats(formats, min_side):
+    """
+    Returns the best format for min_side followed by ever cheaper ones to retry with after timeouts:
+    the next smaller stream (cheapest codec first) or, without one, a same size stream with a codec that's
+    at least as cheap and a lower bitrate.
+    """
+    ranked = rank_formats(formats, min_side)
+    chain = ranked[:1]
+    while chain:
+        cur = chain[-1]
+        smaller = [f for f in ranked if _short_side(f) < _short_side(cur)]
+        if not smaller:
+            smaller = [
+                f
+                for f in ranked
+                if _short_side(f) == _short_side(cur) and _cost(f)[0] <= _cost(cur)[0] and _cost(f)[2] < _cost(cur)[2]
+            ]
+        if not smaller:
+            break
+        chain.append(min(smaller, key=lambda f: (-_short_side(f), *_cost(f))))
+    return chain
+
+
+def get_format_selector(retry, resize_size=None):
     """
-    Gets format selector based on retry number.
+    Gets format selector based on retry number and target frame size.
+    Retries take a cheaper format than the last one (they happen when it was too slow to read).
     """
+    min_side = QUALITY if resize_size is None else resize_size
 
     def format_selector(ctx):
-        formats = ctx.get("formats")
-        if retry == 0:
-            for f in formats:
-                if f.get("format_note", None) != QUALITY:
-                    continue
-                break
-        else:
-            for f in formats:  # take WORST video format available
-                if f.get("vcodec", None) == "none":
-                    continue
-                break
+        formats = fallback_formats(ctx.get("formats"), min_side)
+        if len(formats) == 0:
+            return
+        f = formats[min(retry, len(formats) - 1)]
         yield {
             "format_id": f["format_id"],
             "ext": f["ext"],
@@ -34,12 +89,12 @@ def get_format_selector(retry):
     return format_selector
 
 
-def handle_youtube(youtube_url, retry):
+def handle_youtube(youtube_url, retry, resize_size=None):
     """returns file and destination name from youtube url."""
 
     ydl_opts = {
         "quiet": True,
-        "format": get_format_selector(retry),
+        "format": get_format_selector(retry, resize_size),
     }
 
     ydl = yt_dlp.YoutubeDL(ydl_opts)
@@ -61,10 +116,12 @@ def handle_mp4_link(mp4_link):
     return ntf, dst_name
 
 
-def handle_url(url, retry=0):
+def handle_url(url, retry=0, resize_size=None):
     """
     Input:
         url: url of video
+        retry: number of previous failed attempts at reading the video
+        resize_size: size frames will be resized to, picks the stream resolution (None = 360p)
 
     Output:
         load_file - variable used to load video.
@@ -72,7 +129,7 @@ def handle_url(url, retry=0):
         name - numpy fname to save frames to.
     """
     if "youtube" in url:  # youtube link
-        load_file, name = handle_youtube(url, retry)
+        load_file, name = handle_youtube(url, retry, resize_size)
         return load_file, None, name
     elif url.endswith(".mp4"):  # mp4 link
         file, name = handle_mp4_link(url)
@@ -5,7 +5,9 @@ import numpy as np
 from .frame_reader import FrameReader
 
 
-def video2numpy(src, dest="", take_every_nth=1, target_fps=-1, resize_size=224, workers=1, memory_size=4):
+def video2numpy(
+    src, dest="", take_every_nth=1, target_fps=-1, resize_size=224, workers=1, memory_size=4, dedup_inputs=False
+):
     """
     Read frames from videos and save as numpy arrays
 
@@ -28,6 +30,8 @@ def video2numpy(src, dest="", take_every_nth=1, target_fps=-1, resize_size=224,
         int: number of workers used to read videos
     memory_size:
         int: number of GB of shared memory used for reading, use larger shared memory for more videos
+    dedup_inputs:
+        bool: read and save duplicate videos (same link or path, spelled differently) only once
     """
     if isinstance(src, str):
         if src.endswith(".txt"):  # list of mp4s or youtube links
@@ -39,10 +43,24 @@ def video2numpy(src, dest="", take_every_nth=1, target_fps=-1, resize_size=224,
         fnames = src
 
     batch_size = -1
-    reader = FrameReader(fnames, None, take_every_nth, target_fps, resize_size, batch_size, workers, memory_size)
+    reader = FrameReader(
+        fnames,
+        None,
+        take_every_nth,
+        target_fps,
+        resize_size,
+        batch_size,
+        workers,
+        memory_size,
+        dedup_inputs=dedup_inputs,
+    )
     reader.start_reading()
 
+    last_frames = None
     for vid_frames, info in reader:
+        if vid_frames is last_frames:  # duplicates are yielded one after another and share the frames
+            continue
+        last_frames = vid_frames
         dst_name = info["dst_name"]
         save_pth = os.path.join(dest, dst_name)
         np.save(save_pth, vid_frames)